@@ -0,0 +1,86 @@
+"""
+Archive of failed HTTP response bodies under log/archive/.
+Bodies are deduplicated by content hash, gzip-compressed and written by a background thread;
+once the directory exceeds its quota the oldest files are evicted first.
+"""
+
+import gzip
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from base.config import archiveQuota
+
+ARCHIVE_DIR = Path('log/archive')
+MAX_BODY = 1 << 20  # bodies are truncated to 1 MiB before compression
+
+_known: set[Path] = set()
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='archive')
+
+
+def archive(content: str | bytes, suffix: Optional[str] = None) -> str:
+    """
+    Archive content to file, return the file path.
+    The file is written asynchronously; the same content is only stored once.
+    """
+    if isinstance(content, str):
+        data = content.encode()
+    elif isinstance(content, bytes):
+        data = content
+    else:
+        raise TypeError('content must be str or bytes')
+    name = hashlib.sha1(data).hexdigest()[:16] + (f'.{suffix}' if suffix else '') + '.gz'
+    path = ARCHIVE_DIR / name
+    if path not in _known:
+        _known.add(path)
+        _writer.submit(_write, path, data[:MAX_BODY])
+    else:
+        _writer.submit(_touch, path)
+    return str(path)
+
+
+def _touch(path: Path) -> None:
+    """Mark a deduplicated body as recently seen, so that it is evicted last."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        _known.discard(path)
+
+
+def _write(path: Path, data: bytes) -> None:
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        os.utime(path)
+        return
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.write_bytes(gzip.compress(data))
+    os.replace(tmp, path)
+    enforce_quota(ARCHIVE_DIR, archiveQuota)
+
+
+def enforce_quota(folder: Path, quota: int) -> int:
+    """
+    Delete the oldest files in a folder until it fits in `quota` bytes.
+    Return how many files were deleted.
+    """
+    files = [(f.stat(), f) for f in folder.iterdir() if f.is_file()]
+    total = sum(stat.st_size for stat, _ in files)
+    removed = 0
+    for stat, file in sorted(files, key=lambda x: x[0].st_mtime):
+        if total <= quota:
+            break
+        file.unlink(missing_ok=True)
+        _known.discard(file)
+        total -= stat.st_size
+        removed += 1
+    return removed
+
+
+def gzip_rotator(source: str, dest: str) -> None:
+    """Rotator for logging handlers: compress the rotated log."""
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        while chunk := src.read(1 << 20):
+            dst.write(chunk)
+    os.remove(source)
@@ -0,0 +1,196 @@
+"""
+Fan one rendered message out to many chats.
+The ids of the messages sent for each topic are kept per chat in data/broadcast.json, so that they can be
+edited or replaced later, together with the users subscribed to rain alerts by DM.
+A photo is uploaded once and the other chats get its file_id. New messages are sent alongside the deletion of
+the ones they replace, with at most CONCURRENCY calls in flight each.
+"""
+
+import asyncio
+import json
+import logging
+from pathlib import Path
+from typing import Awaitable, Callable, Iterable, Optional
+
+from telegram import Bot, InputMediaPhoto, Message
+from telegram.error import BadRequest, Forbidden
+
+from base import persist
+from base.concurrency import gather_bounded
+from base.config import channel, group
+from base.debug import eprint
+from base.log import logger
+from base.message import delete_msg
+
+PATH = 'data/broadcast.json'
+CONCURRENCY = 8
+# BadRequest messages meaning the stored message will never be editable again
+GONE = ('message to edit not found', "message can't be edited", 'chat not found')
+
+
+def _migrate() -> dict:
+    """Take the message ids from the single-slot files used before."""
+    state: dict = {'subscribers': [], 'messages': {}}
+    try:
+        with open('data/weather_report_msgid.json', 'r') as file:
+            old = json.load(file)
+        state['messages']['weather_report'] = {str(group): old['group'], str(channel): old['channel']}
+    except Exception:
+        pass
+    try:
+        with open('data/weather_msgid.json', 'r') as file:
+            state['messages']['rain_alert'] = {str(group): json.load(file)}
+    except Exception:
+        pass
+    return state
+
+
+try:
+    with open(PATH, 'r') as file:
+        state = json.load(file)
+except Exception:
+    state = _migrate()
+    persist.save(PATH, state)
+
+
+def save() -> None:
+    persist.save(PATH, state)
+
+
+# ==================== subscribers ====================
+
+def subscribers() -> list[int]:
+    return list(state['subscribers'])
+
+
+def subscribe(user_id: int) -> bool:
+    """Return False if already subscribed."""
+    if user_id in state['subscribers']:
+        return False
+    state['subscribers'].append(user_id)
+    save()
+    return True
+
+
+def unsubscribe(user_id: int) -> bool:
+    """Return False if not subscribed."""
+    if user_id not in state['subscribers']:
+        return False
+    state['subscribers'].remove(user_id)
+    save()
+    return True
+
+
+# ==================== fan out ====================
+
+def messages(topic: str) -> dict[str, int]:
+    """chat id -> message id of the latest message of the topic."""
+    return state['messages'].setdefault(topic, {})
+
+
+async def _call(chat_id: int | str, call: Callable[[int | str], Awaitable[Message]]) -> Optional[Message]:
+    try:
+        return await call(chat_id)
+    except Forbidden as e:
+        # 用户屏蔽了 bot，不再私聊推送
+        eprint(e, logging.INFO, f'broadcast to {chat_id} forbidden')
+        if isinstance(chat_id, int) and chat_id > 0:
+            unsubscribe(chat_id)
+    except Exception as e:
+        eprint(e, msg=f'broadcast to {chat_id} failed')
+    return None
+
+
+async def fan_out(chats: Iterable[int | str], call: Callable[[int | str], Awaitable[Message]]) -> dict[str, Message]:
+    """Run `call` for every chat concurrently, return the messages of the chats that succeeded."""
+    chats = list(dict.fromkeys(chats))
+    results = await gather_bounded([_call(chat_id, call) for chat_id in chats], CONCURRENCY)
+    return {str(chat_id): msg for chat_id, msg in zip(chats, results) if isinstance(msg, Message)}
+
+
+async def _delete(sent: dict[str, int]) -> None:
+    await gather_bounded([delete_msg(chat_id, msgid) for chat_id, msgid in sent.items()], CONCURRENCY)
+
+
+def _take(topic: str) -> dict[str, int]:
+    """Forget the latest messages of the topic and return them, to be deleted alongside the new sends."""
+    sent = dict(messages(topic))
+    messages(topic).clear()
+    return sent
+
+
+async def send_text(bot: Bot, topic: str, chats: Iterable[int | str], text: str, **kwargs) -> int:
+    """Replace the latest messages of the topic with `text`, return to how many chats it was sent."""
+    previous = _take(topic)
+    sent, _ = await asyncio.gather(
+        fan_out(chats, lambda chat_id: bot.send_message(chat_id=chat_id, text=text, **kwargs)),
+        _delete(previous))
+    messages(topic).update({chat_id: msg.message_id for chat_id, msg in sent.items()})
+    save()
+    return len(sent)
+
+
+async def send_photo(bot: Bot, topic: str, chats: Iterable[int | str], path: str, caption: str) -> int:
+    """
+    Replace the latest messages of the topic with a photo, return to how many chats it was sent.
+    The photo is uploaded with the first chat that accepts it, the rest get its file_id.
+    """
+    chats = list(dict.fromkeys(chats))
+    sent: dict[str, Message] = {}
+    upload = Path(path).read_bytes()
+
+    async def send() -> None:
+        photo: Optional[str] = None
+        while chats and photo is None:
+            chat_id = chats.pop(0)
+            msg = await _call(chat_id, lambda chat_id: bot.send_photo(chat_id, upload, caption))
+            if msg is not None:
+                sent[str(chat_id)] = msg
+                photo = msg.photo[-1].file_id
+        if photo is not None:
+            sent.update(await fan_out(chats, lambda chat_id: bot.send_photo(chat_id, photo, caption)))
+
+    previous = _take(topic)
+    await asyncio.gather(send(), _delete(previous))
+    messages(topic).update({chat_id: msg.message_id for chat_id, msg in sent.items()})
+    save()
+    return len(sent)
+
+
+async def edit_photo(bot: Bot, topic: str, path: str, caption: str) -> int:
+    """
+    Replace the photo and caption of the latest messages of the topic, return how many were edited.
+    The photo is uploaded with the first edit that succeeds, the rest get its file_id.
+    Chats whose message is gone (deleted, or the bot was removed) are forgotten.
+    """
+    targets = list(messages(topic).items())
+    upload = Path(path).read_bytes()
+    photo: Optional[str] = None
+    edited = 0
+    gone: list[str] = []
+
+    async def edit(chat_id: int | str, media) -> Message:
+        try:
+            msg = await bot.edit_message_media(chat_id=chat_id, message_id=messages(topic)[str(chat_id)],
+                                               media=InputMediaPhoto(media=media, caption=caption))
+        except (BadRequest, Forbidden) as e:
+            if isinstance(e, Forbidden) or any(reason in e.message.lower() for reason in GONE):
+                gone.append(str(chat_id))
+            raise
+        assert isinstance(msg, Message)
+        return msg
+
+    while targets and photo is None:
+        chat_id, _ = targets.pop(0)
+        msg = await _call(chat_id, lambda chat_id: edit(chat_id, upload))
+        if msg is not None and msg.photo:
+            photo = msg.photo[-1].file_id
+            edited += 1
+    if photo is not None:
+        edited += len(await fan_out([chat_id for chat_id, _ in targets], lambda chat_id: edit(chat_id, photo)))
+    if gone:
+        for chat_id in gone:
+            messages(topic).pop(chat_id, None)
+        save()
+    logger.debug(f'broadcast {topic}: {edited} edited, {len(gone)} gone')
+    return edited
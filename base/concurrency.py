@@ -0,0 +1,83 @@
+"""
+Concurrency helpers.
+OrderedUpdateProcessor lets the Application handle updates concurrently while keeping them in order per key:
+updates from the same user (in any chat) run one after another, as do posts of the same channel.
+gather_bounded runs awaitables with at most `limit` of them in flight.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Hashable, Iterable, TypeVar
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+T = TypeVar('T')
+
+
+async def gather_bounded(aws: Iterable[Awaitable[T]], limit: int) -> list[T | BaseException]:
+    """
+    Like asyncio.gather(..., return_exceptions=True), but at most `limit` awaitables run at once.
+    Results are in the order of `aws`, a failed one gives its exception.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(aw: Awaitable[T]) -> T:
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*(run(aw) for aw in aws), return_exceptions=True)
+
+
+def order_key(update: object) -> Hashable:
+    """Updates with the same key are processed in the order they arrive, None for no ordering."""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user is not None:
+        return ('user', update.effective_user.id)
+    if update.effective_chat is not None:
+        return ('chat', update.effective_chat.id)
+    return None
+
+
+class OrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    At most `max_concurrent_updates` updates run at once, updates of the same key never overlap.
+    An update takes the lock of its key before a slot of the semaphore, so the updates queued behind
+    a busy key (a burst of pipe posts, one user repeating a slow command) don't hold slots other chats need.
+    The Application creates the processing tasks in arrival order and both the semaphore and the locks
+    are FIFO, so updates of one key also start in arrival order.
+    """
+
+    __slots__ = ('_locks',)
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._locks: dict[Hashable, tuple[asyncio.Lock, int]] = {}  # key -> (lock, number of users)
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = order_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+        lock, users = self._locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                await super().process_update(update, coroutine)
+        finally:
+            lock, users = self._locks[key]
+            if users == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
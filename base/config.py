@@ -5,16 +5,29 @@ config.read('config.ini')
 
 accessToken = config['BOT']['accesstoken']
 
+owner = int(config['BOT'].get('owner') or 0)
 group = config['BOT'].getint('group')
 channel = config['BOT'].getint('channel')
 pipe = config['BOT'].getint('pipe')
+# 天气预报与降雨预警推送到的群和频道，逗号分隔；订阅了预警的用户另外私聊推送
+reportChats = [int(x) for x in (config['BOT'].get('report_chats') or f'{group},{channel}').split(',') if x.strip()]
+alertChats = [int(x) for x in (config['BOT'].get('alert_chats') or f'{group}').split(',') if x.strip()]
+workers = config.getint('BOT', 'workers', fallback=8)  # 同时处理的 update 数，同一用户的 update 依然按顺序处理
+useUvloop = config.getboolean('BOT', 'uvloop', fallback=False)  # 安装了 uvloop 时用它作为事件循环
 
 logFile = config['BOT']['logpath'] + 'server'
+logDebugRate = config.getint('LOG', 'debug_rate', fallback=0)  # 每个调用点每分钟最多记录的 DEBUG 条数，0 为不限
+lagThreshold = config.getfloat('LOG', 'lag_threshold', fallback=0.25)  # 事件循环阻塞超过该秒数时记录调用栈
+archiveQuota = int(config.getfloat('LOG', 'archive_quota_mb', fallback=100) * 2**20)  # log/archive 的容量上限
 
 heartbeatURL = config['BOT'].get('heartbeat')
 
 caiyunToken = config['CAIYUN']['token']
 
+# 合并短时间内连续到达的 info：静默 quiet 秒或累计 max 秒后一并发送
+coalesceQuiet = config.getfloat('INFO', 'coalesce_quiet', fallback=3)
+coalesceMax = config.getfloat('INFO', 'coalesce_max', fallback=20)
+
 webhookConfig = {
     'listen': config['WEBHOOK']['listen'],
     'port': int(config['WEBHOOK']['port']),
@@ -22,3 +35,9 @@ webhookConfig = {
     'webhook_url': config['WEBHOOK']['webhook_url'],
     'secret_token': config['WEBHOOK']['secret_token']
 }
+
+# Prometheus 格式的监控指标，端口为 0 时不开启
+metricsConfig = {
+    'listen': config.get('WEBHOOK', 'metrics_listen', fallback='127.0.0.1'),
+    'port': config.getint('WEBHOOK', 'metrics_port', fallback=0),
+}
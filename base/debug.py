@@ -1,8 +1,6 @@
 import asyncio
 import functools
 import logging
-import traceback
-from datetime import datetime
 from typing import Callable, Optional
 
 from base.log import logger
@@ -35,7 +33,8 @@ def eprint(e: Exception, level: int = logging.WARNING, msg: Optional[str] = None
     logger.log(level, exception_str, stacklevel=stacklevel)
 
     if print_trace:
-        logger.debug(traceback.format_exc(), stacklevel=stacklevel)
+        # 交给日志线程格式化 traceback
+        logger.debug(exception_str, exc_info=e, stacklevel=stacklevel)
 
 
 def try_except(level: int = logging.WARNING, msg: Optional[str] = None, return_value: bool = True, exclude=(IgnoreWarning,)) -> Callable:
@@ -72,17 +71,3 @@ def try_except(level: int = logging.WARNING, msg: Optional[str] = None, return_v
             return wrap
     return decorate
 
-
-def archive(content: str | bytes, suffix: Optional[str] = None) -> str:
-    """
-    Archive content to file.
-    """
-    now = str(datetime.now()).replace(' ', '_').replace(':', '-')
-    filepath = f'log/archive/{now}' + (f'.{suffix}' if suffix else '')
-    if isinstance(content, str):
-        open(filepath, 'w').write(content)
-    elif isinstance(content, bytes):
-        open(filepath, 'wb').write(content)
-    else:
-        raise TypeError('content must be str or bytes')
-    return filepath
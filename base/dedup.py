@@ -0,0 +1,152 @@
+"""
+Duplicate suppression for the info pipe.
+Items are keyed by normalized url and by a MinHash signature of the title's character bigrams.
+The signature is split into LSH bands, so a lookup only inspects the buckets sharing a band,
+and the candidates are confirmed by the exact Jaccard similarity of their bigram sets.
+A near-duplicate must also carry the same numbers (dates, 第N批, （N）), which the bigrams barely weigh.
+Urls are remembered for WINDOW, titles only for TITLE_WINDOW, so that recurring notices get through;
+short titles only match the same source.
+"""
+
+import hashlib
+import random
+import re
+import time
+from collections import deque
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+WINDOW = 14 * 24 * 3600  # seconds
+TITLE_WINDOW = 24 * 3600  # seconds a title (exact or similar) counts as a duplicate
+SIMILARITY = 0.7  # Jaccard similarity of title bigrams
+BANDS = 8
+ROWS = 4
+MIN_TITLE = 8  # shorter titles only match exactly
+
+PRIME = (1 << 61) - 1
+_rd = random.Random(0)
+HASHES = [(_rd.randrange(1, PRIME), _rd.randrange(0, PRIME)) for _ in range(BANDS * ROWS)]
+
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Ignore scheme, default port, `www.`, fragment, trailing slash, tracking params and query order.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if parts.port is not None and str(parts.port) != DEFAULT_PORTS.get(scheme):
+        host += f':{parts.port}'
+    path = parts.path.rstrip('/') or '/'
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                             if not k.startswith('utm_')))
+    return urlunsplit(('', host, path, query, ''))
+
+
+def normalize_title(title: str) -> str:
+    return re.sub(r'[\s\W_]+', '', title.lower())
+
+
+def numbers(text: str) -> tuple[str, ...]:
+    """Runs of digits and Chinese numerals, sorted so that rewording doesn't matter."""
+    return tuple(sorted(re.findall(r'\d+|[零〇一二三四五六七八九十百千万两]+', text)))
+
+
+def bigrams(text: str) -> frozenset[str]:
+    return frozenset(text[i:i+2] for i in range(max(len(text) - 1, 1)))
+
+
+def minhash(grams: frozenset[str]) -> list[tuple[int, tuple[int, ...]]]:
+    """MinHash signature of the bigrams, grouped into LSH bands."""
+    values = [int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=8).digest(), 'big')
+              for gram in grams]
+    signature = [min((a * x + b) % PRIME for x in values) for a, b in HASHES]
+    return [(i, tuple(signature[i*ROWS:(i+1)*ROWS])) for i in range(BANDS)]
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / len(a | b)
+
+
+class Entry:
+    __slots__ = ('url', 'key', 'source', 'title', 'title_key', 'numbers', 'grams', 'bands', 'time')
+
+    def __init__(self, url: str, source: str, title: str, now: float):
+        self.url = url
+        self.key = normalize_url(url)
+        self.source = source
+        self.title = normalize_title(title)
+        # short titles (讲座通知) are shared by unrelated sources
+        self.title_key = self.title if len(self.title) >= MIN_TITLE else f'{source}\0{self.title}'
+        self.numbers = numbers(self.title)
+        self.grams = bigrams(self.title)
+        self.bands = minhash(self.grams) if len(self.title) >= MIN_TITLE else []
+        self.time = now
+
+
+class DedupIndex:
+    def __init__(self, window: float = WINDOW):
+        self.window = window
+        self.by_url: dict[str, Entry] = {}
+        self.by_title: dict[str, Entry] = {}  # title_key -> the latest entry
+        self.buckets: dict[tuple[int, tuple[int, ...]], set[Entry]] = {}
+        self.queue: deque[Entry] = deque()
+
+    def __len__(self):
+        return len(self.by_url)
+
+    def expire(self, now: float) -> None:
+        while self.queue and self.queue[0].time < now - self.window:
+            self._discard(self.queue.popleft())
+
+    def _discard(self, entry: Entry) -> None:
+        if self.by_url.get(entry.key) is entry:
+            del self.by_url[entry.key]
+        if self.by_title.get(entry.title_key) is entry:
+            del self.by_title[entry.title_key]
+        for band in entry.bands:
+            bucket = self.buckets.get(band)
+            if bucket is not None:
+                bucket.discard(entry)
+                if not bucket:
+                    del self.buckets[band]
+
+    def find(self, url: str, source: str, title: str, now: Optional[float] = None) -> Optional[Entry]:
+        """
+        Return the earlier entry this item duplicates, None if it is new.
+        """
+        now = time.time() if now is None else now
+        self.expire(now)
+        probe = Entry(url, source, title, now)
+        if probe.key in self.by_url:
+            return self.by_url[probe.key]
+        entry = self.by_title.get(probe.title_key)
+        if entry is not None and now - entry.time <= TITLE_WINDOW:
+            return entry
+        for band in probe.bands:
+            for entry in self.buckets.get(band, ()):
+                if (now - entry.time <= TITLE_WINDOW and entry.numbers == probe.numbers
+                        and jaccard(entry.grams, probe.grams) >= SIMILARITY):
+                    return entry
+        return None
+
+    def add(self, url: str, source: str, title: str, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        entry = Entry(url, source, title, now)
+        old = self.by_url.get(entry.key)
+        if old is not None:
+            self._discard(old)
+        self.by_url[entry.key] = entry
+        self.by_title[entry.title_key] = entry
+        for band in entry.bands:
+            self.buckets.setdefault(band, set()).add(entry)
+        self.queue.append(entry)
+
+    def remove(self, url: str) -> None:
+        entry = self.by_url.get(normalize_url(url))
+        if entry is not None:
+            self._discard(entry)
@@ -0,0 +1,208 @@
+"""
+SQLite store for the items relayed from the info pipe.
+Every channel post costs one row write, and items are kept across days.
+Titles and sources are indexed by character bigrams for full-text search.
+"""
+
+import heapq
+import json
+import math
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS info (
+    id      INTEGER PRIMARY KEY,
+    url     TEXT NOT NULL UNIQUE,
+    source  TEXT NOT NULL,
+    title   TEXT NOT NULL,
+    msgid   INTEGER,
+    dup_of  TEXT,
+    created REAL NOT NULL,
+    data    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS info_source ON info (source, created);
+CREATE INDEX IF NOT EXISTS info_created ON info (created);
+CREATE INDEX IF NOT EXISTS info_msgid ON info (msgid);
+CREATE TABLE IF NOT EXISTS info_gram (
+    gram TEXT NOT NULL,
+    item INTEGER NOT NULL,
+    PRIMARY KEY (gram, item)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS info_gram_item ON info_gram (item);
+'''
+
+
+conn: sqlite3.Connection
+
+
+def connect(path: str) -> None:
+    """Open (and create) the database, `:memory:` gives a throwaway one."""
+    global conn
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    if 'dup_of' not in {row['name'] for row in conn.execute('PRAGMA table_info(info)')}:
+        conn.execute('ALTER TABLE info ADD COLUMN dup_of TEXT')
+
+
+connect('data/info.db')
+
+POSTINGS = 2000
+
+
+@contextmanager
+def transaction():
+    if conn.in_transaction:
+        yield
+        return
+    conn.execute('BEGIN')
+    try:
+        yield
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+def ngrams(text: str) -> set[str]:
+    """
+    Character bigrams of each word, single-character words are kept as they are.
+    """
+    grams = set()
+    for word in re.split(r'[\s\W_]+', text.lower()):
+        if len(word) == 1:
+            grams.add(word)
+        grams.update(word[i:i+2] for i in range(len(word) - 1))
+    return grams
+
+
+def index_info(item: int, source: str, title: str) -> None:
+    conn.execute('DELETE FROM info_gram WHERE item = ?', (item,))
+    conn.executemany('INSERT INTO info_gram (gram, item) VALUES (?, ?)',
+                     [(gram, item) for gram in ngrams(source + ' ' + title)])
+
+
+def add_info(data: dict, msgid: Optional[int], dup_of: Optional[str] = None) -> None:
+    """
+    Insert an item, replacing the previous one with the same url.
+    `dup_of` is the url of the item it duplicates, such items are left out of the daily report.
+    """
+    with transaction():
+        conn.execute(
+            'INSERT INTO info (url, source, title, msgid, dup_of, created, data) VALUES (?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (url) DO UPDATE SET source = excluded.source, title = excluded.title, '
+            'msgid = excluded.msgid, dup_of = excluded.dup_of, created = excluded.created, data = excluded.data',
+            (data['url'], data['source'], data['title'], msgid, dup_of, time.time(), json.dumps(data)))
+        item = conn.execute('SELECT id FROM info WHERE url = ?', (data['url'],)).fetchone()['id']
+        index_info(item, data['source'], data['title'])
+
+
+def pop_info(url: str) -> tuple[bool, Optional[int]]:
+    """
+    Delete an item.
+    Return whether it existed and the message id it was sent as.
+    """
+    row = conn.execute('SELECT id, msgid FROM info WHERE url = ?', (url,)).fetchone()
+    if row is None:
+        return False, None
+    with transaction():
+        conn.execute('DELETE FROM info WHERE id = ?', (row['id'],))
+        conn.execute('DELETE FROM info_gram WHERE item = ?', (row['id'],))
+    return True, row['msgid']
+
+
+def set_msgid(urls: list[str], msgid: Optional[int]) -> None:
+    with transaction():
+        conn.executemany('UPDATE info SET msgid = ? WHERE url = ?', [(msgid, url) for url in urls])
+
+
+def info_by_msgid(msgid: int) -> list[dict]:
+    """
+    Return the items sent as one message, in the order they arrived.
+    """
+    return [dict(row) for row in conn.execute(
+        'SELECT source, title, url FROM info WHERE msgid = ? ORDER BY id', (msgid,))]
+
+
+def info_since(since: float) -> dict[str, list[dict]]:
+    """
+    Return the items created after `since`, grouped by source, without the duplicates.
+    """
+    ret: dict[str, list[dict]] = {}
+    for row in conn.execute(
+            'SELECT source, title, url FROM info WHERE created >= ? AND dup_of IS NULL '
+            'ORDER BY source, created', (since,)):
+        ret.setdefault(row['source'], []).append(
+            {'source': row['source'], 'title': row['title'], 'url': row['url']})
+    return ret
+
+
+def iter_info(since: float):
+    """
+    Iterate over the items created after `since`, oldest first.
+    """
+    yield from conn.execute(
+        'SELECT url, source, title, created FROM info WHERE created >= ? ORDER BY created', (since,))
+
+
+def search_info(query: str, limit: int = 10) -> list[dict]:
+    """
+    Rank items by the idf-weighted bigrams they share with the query, newer first on ties.
+    Only the latest POSTINGS items of each bigram are scored, which bounds the cost of common bigrams.
+    Items matching less than half of the query weight are dropped.
+    """
+    grams = ngrams(query)
+    if not grams:
+        return []
+    total = conn.execute('SELECT COUNT(*) FROM info').fetchone()[0]
+    scores: dict[int, float] = {}
+    weights = 0.0
+    for gram in grams:
+        df = conn.execute('SELECT COUNT(*) FROM info_gram WHERE gram = ?', (gram,)).fetchone()[0]
+        weight = math.log((total + 1) / (df + 0.5))
+        weights += weight
+        for (item,) in conn.execute(
+                'SELECT item FROM info_gram WHERE gram = ? ORDER BY item DESC LIMIT ?', (gram, POSTINGS)):
+            scores[item] = scores.get(item, 0) + weight
+    best = heapq.nlargest(limit, ((score, item) for item, score in scores.items() if score >= weights / 2))
+    ret = []
+    for score, item in best:
+        row = conn.execute('SELECT source, title, url, created FROM info WHERE id = ?', (item,)).fetchone()
+        ret.append(dict(row) | {'score': score})
+    return ret
+
+
+def _migrate(path: Path) -> None:
+    """Import the items left in the legacy today.json."""
+    if not path.exists():
+        return
+    try:
+        today = json.loads(path.read_text())
+        with transaction():
+            for data in today.values():
+                msgid = data.pop('msgid', None)
+                add_info(data, msgid)
+        path.unlink()
+    except Exception:
+        pass
+
+
+def _backfill() -> None:
+    """Index the items stored before the search index existed."""
+    rows = conn.execute(
+        'SELECT id, source, title FROM info WHERE NOT EXISTS '
+        '(SELECT 1 FROM info_gram WHERE info_gram.item = info.id)').fetchall()
+    with transaction():
+        for row in rows:
+            index_info(row['id'], row['source'], row['title'])
+
+
+_migrate(Path('data/today.json'))
+_backfill()
@@ -0,0 +1,140 @@
+"""
+Instrumented JobQueue callbacks.
+@tracked_job refuses to start a run of a repeating job while its previous run is still going
+(a one-shot job waits for it instead, since nothing would run it again),
+and records how long each run took and how late it started.
+Lateness and coalesced runs come from the scheduler's events, see listen().
+"""
+
+import asyncio
+import functools
+import time
+from datetime import datetime
+from typing import Optional
+
+from apscheduler.events import (EVENT_JOB_MAX_INSTANCES, EVENT_JOB_SUBMITTED,
+                                JobSubmissionEvent)
+from apscheduler.triggers.date import DateTrigger
+from telegram.ext import ContextTypes, JobQueue
+
+from base.log import logger
+from base.metrics import Counter, Gauge, Histogram
+
+job_runs = Counter('bot_job_runs_total', 'Job runs, by job and outcome (ok, failed, skipped, coalesced)',
+                   ('job', 'outcome'))
+job_seconds = Histogram('bot_job_seconds', 'Duration of job runs', ('job',))
+job_lateness = Gauge('bot_job_lateness_seconds', 'How late the latest run of a job started', ('job',))
+
+
+class JobStats:
+    __slots__ = ('runs', 'failed', 'skipped', 'coalesced', 'total', 'longest', 'last',
+                 'lateness', 'latest', 'started', 'finished')
+
+    def __init__(self):
+        self.runs = 0
+        self.failed = 0
+        self.skipped = 0  # the last run was still going
+        self.coalesced = 0  # missed runs merged into one
+        self.total = 0.0  # seconds
+        self.longest = 0.0
+        self.last = 0.0
+        self.lateness = 0.0  # the latest run
+        self.latest = 0.0  # the largest lateness
+        self.started: Optional[float] = None  # time.time() of the run in progress
+        self.finished: Optional[float] = None
+
+
+stats: dict[str, JobStats] = {}
+_scheduled: dict[str, datetime] = {}  # APScheduler job id -> scheduled time of the run just submitted
+job_queue: Optional[JobQueue] = None
+
+
+def tracked_job(func):
+    name = func.__name__
+    stats[name] = JobStats()
+    lock = asyncio.Lock()
+
+    @functools.wraps(func)
+    async def wrap(context: ContextTypes.DEFAULT_TYPE):
+        entry = stats[name]
+        scheduled = _scheduled.pop(context.job.id, None) if context.job else None
+        once = context.job is not None and isinstance(getattr(context.job.job, 'trigger', None), DateTrigger)
+        if lock.locked() and not once:
+            entry.skipped += 1
+            job_runs.labels(name, 'skipped').inc()
+            logger.warning(f'job {name} skipped, the last run started {time.time() - entry.started:.1f}s ago')
+            return
+        async with lock:
+            entry.started = time.time()
+            if scheduled is not None:
+                entry.lateness = max(0.0, entry.started - scheduled.timestamp())
+                entry.latest = max(entry.latest, entry.lateness)
+                job_lateness.labels(name).set(entry.lateness)
+            start = time.perf_counter()
+            outcome = 'failed'
+            try:
+                ret = await func(context)
+                outcome = 'ok'
+                return ret
+            except Exception:
+                entry.failed += 1
+                raise
+            finally:
+                duration = time.perf_counter() - start
+                job_runs.labels(name, outcome).inc()
+                job_seconds.labels(name).observe(duration)
+                entry.runs += 1
+                entry.total += duration
+                entry.last = duration
+                entry.longest = max(entry.longest, duration)
+                entry.started = None
+                entry.finished = time.time()
+    return wrap
+
+
+def _on_submitted(event: JobSubmissionEvent) -> None:
+    _scheduled[event.job_id] = max(event.scheduled_run_times)
+    if len(event.scheduled_run_times) > 1:
+        job = _job_name(event.job_id)
+        if job in stats:
+            stats[job].coalesced += len(event.scheduled_run_times) - 1
+            job_runs.labels(job, 'coalesced').inc(len(event.scheduled_run_times) - 1)
+
+
+def _on_max_instances(event: JobSubmissionEvent) -> None:
+    job = _job_name(event.job_id)
+    if job in stats:
+        stats[job].skipped += 1
+        job_runs.labels(job, 'skipped').inc()
+
+
+def _job_name(job_id: str) -> Optional[str]:
+    job = job_queue.scheduler.get_job(job_id) if job_queue else None
+    return job.name if job else None
+
+
+def listen(_job_queue: JobQueue) -> None:
+    """Follow the scheduler's events to record lateness and coalesced or skipped runs."""
+    global job_queue
+    job_queue = _job_queue
+    job_queue.scheduler.add_listener(_on_submitted, EVENT_JOB_SUBMITTED)
+    job_queue.scheduler.add_listener(_on_max_instances, EVENT_JOB_MAX_INSTANCES)
+
+
+def report() -> str:
+    lines = []
+    for name, x in sorted(stats.items()):
+        if x.runs == 0 and x.skipped == 0 and x.started is None:
+            continue
+        line = (f'{name}: {x.runs} runs, avg {x.total / max(x.runs, 1):.2f}s, max {x.longest:.2f}s, '
+                f'late {x.lateness:.2f}s (max {x.latest:.2f}s)')
+        if x.failed:
+            line += f', {x.failed} failed'
+        if x.skipped:
+            line += f', {x.skipped} skipped'
+        if x.coalesced:
+            line += f', {x.coalesced} coalesced'
+        if x.started is not None:
+            line += f', running for {time.time() - x.started:.1f}s'
+        lines.append(line)
+    return '\n'.join(lines) or 'No job has run yet'
@@ -1,11 +1,17 @@
+import atexit
+import copy
 import logging
+import queue
 import sys
+import time
 from logging import Filter, StreamHandler
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import (QueueHandler, QueueListener,
+                              TimedRotatingFileHandler)
 
 import colorlog
 
-from base.config import logFile
+from base.archive import gzip_rotator
+from base.config import logDebugRate, logFile
 from base.sentry import sentry_init
 
 sentry_init()
@@ -27,9 +33,52 @@ class MaxFilter(Filter):
             return True
 
 
+class RateLimitFilter(Filter):
+    """
+    Let at most `rate` DEBUG records per minute through from each call site.
+    The next record let through after a drop reports how many were dropped.
+    """
+
+    def __init__(self, rate: int):
+        self.rate = rate
+        self.windows: dict[tuple[str, int], list] = {}  # site -> [window start, passed, dropped]
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        now = time.monotonic()
+        window = self.windows.setdefault((record.pathname, record.lineno), [now, 0, 0])
+        if now - window[0] >= 60:
+            window[0], window[1] = now, 0
+        if window[1] >= self.rate:
+            window[2] += 1
+            return False
+        window[1] += 1
+        if window[2]:
+            record.msg = f'{record.msg} ({window[2]} similar messages suppressed)'
+            window[2] = 0
+        return True
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Hand records over to a QueueListener without formatting them,
+    the message and the traceback are formatted in the listener thread.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
 class EnhancedRotatingFileHandler(TimedRotatingFileHandler):
     def __init__(self, filename, when='h', interval=1, backupCount=0, encoding=None, delay=False, utc=False):
         super().__init__(filename, when, interval, backupCount, encoding, delay, utc)
+        # 轮转出的日志压缩保存，轮转发生在日志线程中
+        self.namer = lambda name: name + '.gz'
+        self.rotator = gzip_rotator
 
     def computeRollover(self, currentTime: int):
         """
@@ -58,13 +107,27 @@ fhlr = EnhancedRotatingFileHandler(
 fhlr.setFormatter(basic_formatter)
 fhlr.setLevel('DEBUG')
 
+# 日志经由队列交给后台线程写入，调用方不做 I/O
+root_queue: queue.SimpleQueue = queue.SimpleQueue()
+root_listener = QueueListener(root_queue, fhlr, respect_handler_level=True)
+self_queue: queue.SimpleQueue = queue.SimpleQueue()
+self_listener = QueueListener(self_queue, chlr, ehlr, respect_handler_level=True)
+root_listener.start()
+self_listener.start()
+atexit.register(root_listener.stop)
+atexit.register(self_listener.stop)
+
 # 自行调用 + 模组调用
 logger = logging.getLogger()
 logger.setLevel('INFO')  # 改成 DEBUG 之后，模组自身调用的 logger 也会输出
-logger.addHandler(fhlr)
+qhlr = LazyQueueHandler(root_queue)
+if logDebugRate > 0:
+    qhlr.addFilter(RateLimitFilter(logDebugRate))
+logger.addHandler(qhlr)
 
 # 自行调用
 logger = logging.getLogger(__name__)
 logger.setLevel('DEBUG')
-logger.addHandler(chlr)
-logger.addHandler(ehlr)
+shlr = LazyQueueHandler(self_queue)
+shlr.setLevel('INFO')  # 控制台最低只输出 INFO，DEBUG 只经由 root 写入文件
+logger.addHandler(shlr)
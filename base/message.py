@@ -1,9 +1,14 @@
+import functools
 import logging
 
 from telegram import Bot
 from telegram.error import TimedOut
 
 from base.debug import try_except
+from base.metrics import Counter
+
+calls = Counter('bot_message_calls_total', 'Calls of the base.message helpers, by helper and result',
+                ('helper', 'result'))
 
 
 def init(_bot: Bot):
@@ -16,6 +21,16 @@ Using "msg" instead of "message" to avoid conflict with the message module in th
 """
 
 
+def counted(func):
+    @functools.wraps(func)
+    async def wrap(*args, **kwargs):
+        ok = await func(*args, **kwargs)
+        calls.labels(func.__name__, 'ok' if ok else 'failed').inc()
+        return ok
+    return wrap
+
+
+@counted
 @try_except(level=logging.DEBUG, return_value=False, exclude=(TimedOut,))
 async def delete_msg(chat_id: str | int, message_id: int, **kwargs):
     """
@@ -25,6 +40,7 @@ async def delete_msg(chat_id: str | int, message_id: int, **kwargs):
     await bot.delete_message(chat_id=chat_id, message_id=message_id, **kwargs)
 
 
+@counted
 @try_except(level=logging.DEBUG, return_value=False, exclude=(TimedOut,))
 async def edit_msg_text(chat_id: str | int, message_id: int, text: str, **kwargs):
     """
@@ -34,6 +50,7 @@ async def edit_msg_text(chat_id: str | int, message_id: int, text: str, **kwargs
     await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, **kwargs)
 
 
+@counted
 @try_except(level=logging.DEBUG, return_value=False, exclude=(TimedOut,))
 async def send_msg(chat_id: str | int, text: str, **kwargs):
     """
@@ -43,6 +60,7 @@ async def send_msg(chat_id: str | int, text: str, **kwargs):
     await bot.send_message(chat_id=chat_id, text=text, **kwargs)
 
 
+@counted
 @try_except(level=logging.DEBUG, return_value=False, exclude=(TimedOut,))
 async def edit_msg_media(chat_id: str | int, message_id: int, media, **kwargs):
     """
@@ -0,0 +1,183 @@
+"""
+Metrics in the Prometheus text exposition format, served over HTTP on a local port.
+Counter, Gauge and Histogram register themselves on creation; metrics with labels are used via labels(...).
+"""
+
+import math
+from abc import ABC, abstractmethod
+from typing import Callable, Iterator, Optional
+
+from aiohttp import web
+
+from base.log import logger
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, math.inf)
+
+registry: list['Metric'] = []
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric(ABC):
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children: dict[tuple[str, ...], object] = {}
+        registry.append(self)
+
+    @abstractmethod
+    def _new_child(self):
+        """A fresh child holding the value of one set of labels."""
+
+    def labels(self, *values):
+        assert len(values) == len(self.labelnames), f'{self.name} expects labels {self.labelnames}'
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        """(name suffix, labels, value) of every sample."""
+        for key, child in list(self._children.items()):
+            yield '', format_labels(self.labelnames, key), child.get()  # type: ignore
+
+    def expose(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        lines += [f'{self.name}{suffix}{labels} {format_value(value)}' for suffix, labels, value in self.samples()]
+        return '\n'.join(lines)
+
+
+class _Value:
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """The value is read from `function` at scrape time."""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class Counter(Metric):
+    type = 'counter'
+    _new_child = _Value
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    type = 'gauge'
+    _new_child = _Value
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self.labels().set_function(function)
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets if buckets[-1] == math.inf else (*buckets, math.inf)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _Histogram(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        for key, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(child.buckets, child.counts):  # type: ignore
+                cumulative += count
+                yield '_bucket', format_labels(self.labelnames, key, f'le="{format_value(bound)}"'), cumulative
+            yield '_sum', format_labels(self.labelnames, key), child.sum  # type: ignore
+            yield '_count', format_labels(self.labelnames, key), cumulative
+
+
+def exposition() -> str:
+    return '\n'.join(metric.expose() for metric in registry) + '\n'
+
+
+# ==================== server ====================
+
+_runner: Optional[web.AppRunner] = None
+
+
+async def _handle(request: web.Request) -> web.Response:
+    return web.Response(body=exposition().encode(),
+                        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+async def start_server(listen: str, port: int) -> None:
+    """Serve GET /metrics, port 0 disables it."""
+    global _runner
+    if port == 0:
+        return
+    app = web.Application()
+    app.router.add_get('/metrics', _handle)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, listen, port).start()
+    logger.info(f'metrics on http://{listen}:{port}/metrics')
+
+
+async def stop_server() -> None:
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
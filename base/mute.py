@@ -1,41 +1,132 @@
+"""
+Mute rules:
+    教务处          exact source
+    教务处*         glob over source (*, ?, [...])
+    title:考试      keyword in title
+Exact sources live in a set, the glob and keyword rules are compiled into one regex each,
+so a match costs the same no matter how many rules there are.
+"""
+
+import fnmatch
 import json
+import re
+from collections import Counter
+from typing import Optional
 
 from telegram import Update
 from telegram.ext import ContextTypes
 
+from base import persist
+
+TITLE_PREFIX = 'title:'
+
 try:
     with open('data/mute.json', 'r') as file:
         muted = json.load(file)
 except:
     muted = []
 
+exact_sources: set[str] = set()
+glob_rules: list[str] = []
+source_pattern: Optional[re.Pattern] = None
+title_pattern: Optional[re.Pattern] = None
+
+suppressed = 0
+suppressed_by: Counter[str] = Counter()
+
+
+def is_glob(rule: str) -> bool:
+    return any(c in rule for c in '*?[')
+
+
+def compile_rules() -> None:
+    """Rebuild the matchers from `muted`."""
+    global source_pattern, title_pattern
+    exact_sources.clear()
+    glob_rules.clear()
+    keywords = []
+    for rule in muted:
+        if rule.startswith(TITLE_PREFIX):
+            if rule != TITLE_PREFIX:
+                keywords.append(re.escape(rule[len(TITLE_PREFIX):]))
+        elif is_glob(rule):
+            glob_rules.append(rule)
+        else:
+            exact_sources.add(rule)
+    globs = [f'(?P<g{i}>{fnmatch.translate(rule)})' for i, rule in enumerate(glob_rules)]
+    source_pattern = re.compile('|'.join(globs)) if globs else None
+    title_pattern = re.compile('|'.join(keywords)) if keywords else None
+
+
+def match(source: str, title: str = '') -> Optional[str]:
+    """
+    Return the rule muting this post, None if it is not muted.
+    """
+    if source in exact_sources:
+        return source
+    if source_pattern is not None:
+        m = source_pattern.match(source)
+        if m is not None:
+            return glob_rules[int(m.lastgroup[1:])]  # type: ignore
+    if title_pattern is not None:
+        m = title_pattern.search(title)
+        if m is not None:
+            return TITLE_PREFIX + m.group(0)
+    return None
+
+
+def is_muted(source: str, title: str = '') -> bool:
+    """
+    Check whether a post is muted, and count it if so.
+    """
+    global suppressed
+    rule = match(source, title)
+    if rule is None:
+        return False
+    suppressed += 1
+    suppressed_by[rule] += 1
+    return True
+
+
+compile_rules()
+
+
+def save() -> None:
+    compile_rules()
+    persist.save('data/mute.json', muted)
+
 
 async def mute(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     assert update.effective_chat
     if not context.args:
-        await update.effective_chat.send_message('Usage: /mute [source]')
+        await update.effective_chat.send_message(
+            'Usage: /mute [source|prefix*|title:keyword]')
         return
     for each in context.args:
         if each not in muted:
             muted.append(each)
-    with open('data/mute.json', 'w') as file:
-        json.dump(muted, file)
+    save()
     await update.effective_chat.send_message('Muted: ' + ' '.join(context.args))
 
 
 async def unmute(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     assert update.effective_chat
     if not context.args:
-        await update.effective_chat.send_message('Usage: /unmute [source]')
+        await update.effective_chat.send_message('Usage: /unmute [source|prefix*|title:keyword]')
         return
-    for each in context.args:
+    removed = [each for each in context.args if each in muted]
+    unknown = [each for each in context.args if each not in muted]
+    for each in removed:
         muted.remove(each)
-    with open('data/mute.json', 'w') as file:
-        json.dump(muted, file)
-    await update.effective_chat.send_message('Unmuted: ' + ' '.join(context.args))
+    save()
+    text = 'Unmuted: ' + ' '.join(removed)
+    if unknown:
+        text += '\nNot muted: ' + ' '.join(unknown)
+    await update.effective_chat.send_message(text)
 
 
 async def mute_show(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     assert update.effective_chat
-    text = '\n'.join(['Muted list:'] + muted)
+    lines = [f'{rule} ({suppressed_by[rule]})' for rule in muted]
+    text = '\n'.join(['Muted list:'] + lines + [f'Suppressed: {suppressed}'])
     await update.effective_chat.send_message(text)
@@ -1,13 +1,20 @@
 import asyncio
 import functools
 import logging
+import time
 from asyncio.exceptions import TimeoutError
 from typing import Optional
 
 import aiohttp
 from aiohttp.client_exceptions import ContentTypeError
 
-from base.debug import archive, eprint
+from base.archive import archive
+from base.debug import eprint
+from base.metrics import Counter, Histogram
+
+attempts = Counter('bot_network_attempts_total', 'HTTP request attempts, by helper and outcome',
+                   ('helper', 'outcome'))
+attempt_seconds = Histogram('bot_network_attempt_seconds', 'Duration of HTTP request attempts', ('helper',))
 
 
 class ErrorAfterAttempts(Exception):
@@ -29,20 +36,32 @@ class ErrorStatusCode(Exception):
 
 def attempt(times: int, wait: int = 5):
     def decorate(func):
+        helper = func.__name__
+
         @functools.wraps(func)
         async def wrap(*args, **kwargs):
             for _ in range(times):
+                start = time.perf_counter()
+                outcome = 'error'
                 try:
-                    return await func(*args, **kwargs)
+                    ret = await func(*args, **kwargs)
+                    outcome = 'ok'
+                    return ret
                 except TimeoutError as e:
+                    outcome = 'timeout'
                     eprint(e, logging.DEBUG, print_trace=False)
                 except (ErrorStatusCode, ContentTypeError, AssertionError) as e:
+                    outcome = 'retry'
                     eprint(e, logging.DEBUG)
                 except Exception as e:
                     raise e
+                finally:
+                    attempts.labels(helper, outcome).inc()
+                    attempt_seconds.labels(helper).observe(time.perf_counter() - start)
                 if wait > 0:
                     await asyncio.sleep(wait)
             else:
+                attempts.labels(helper, 'exhausted').inc()
                 raise ErrorAfterAttempts(f'Network error in {times} attempts')
         return wrap
     return decorate
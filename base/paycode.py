@@ -0,0 +1,107 @@
+"""
+Index of the payment QRCodes stored under data/pay/<user_id>/<provider>.png:
+    user_id -> provider -> {path, hash, file_id, updated_at}
+Lookups never touch the filesystem; the directories are scanned only to build the index the first time.
+"""
+
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Optional
+
+from base import persist
+
+PAY_DIR = Path('data/pay')
+INDEX = PAY_DIR / 'index.json'
+
+
+def content_hash(buf: bytes | bytearray) -> str:
+    return hashlib.sha256(buf).hexdigest()
+
+
+def _scan() -> dict[str, dict[str, dict]]:
+    """Build the index from the stored files and the legacy file_id.json."""
+    try:
+        legacy = json.loads((PAY_DIR / 'file_id.json').read_text())
+    except Exception:
+        legacy = {}
+    index: dict[str, dict[str, dict]] = {}
+    for folder in PAY_DIR.iterdir() if PAY_DIR.exists() else []:
+        if not folder.is_dir():
+            continue
+        for file in folder.glob('*.png'):
+            cached = legacy.get(f'{folder.name}/{file.name}')
+            stat = file.stat()
+            index.setdefault(folder.name, {})[file.stem] = {
+                'path': str(file),
+                'hash': content_hash(file.read_bytes()),
+                'file_id': cached['file_id'] if cached and cached['mtime'] == stat.st_mtime_ns else None,
+                'updated_at': stat.st_mtime,
+            }
+    return index
+
+
+try:
+    index: dict[str, dict[str, dict]] = json.loads(INDEX.read_text())
+except Exception:
+    index = _scan()
+    PAY_DIR.mkdir(parents=True, exist_ok=True)
+    persist.save(str(INDEX), index)
+
+
+def save() -> None:
+    persist.save(str(INDEX), index)
+
+
+def codes(user_id: int) -> list[dict]:
+    """The codes of a user, ordered by provider."""
+    user = index.get(str(user_id), {})
+    return [dict(user[provider], provider=provider) for provider in sorted(user)]
+
+
+def put(user_id: int, provider: str, buf: bytes | bytearray, file_id: Optional[str]) -> bool:
+    """
+    Store a code.
+    Return False if the same code is already stored.
+    """
+    digest = content_hash(buf)
+    entry = index.get(str(user_id), {}).get(provider)
+    if entry is not None and entry['hash'] == digest:
+        return False
+    path = PAY_DIR / str(user_id) / f'{provider}.png'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(buf)
+    index.setdefault(str(user_id), {})[provider] = {
+        'path': str(path), 'hash': digest, 'file_id': file_id, 'updated_at': time.time()}
+    save()
+    return True
+
+
+def set_file_ids(user_id: int, file_ids: dict[str, str]) -> None:
+    """Record the file_ids of codes, keyed by provider."""
+    for provider, file_id in file_ids.items():
+        index[str(user_id)][provider]['file_id'] = file_id
+    save()
+
+
+def cleanup() -> int:
+    """
+    Drop entries whose file is gone and delete files no entry refers to.
+    Return how many were removed.
+    """
+    removed = 0
+    for user_id in list(index):
+        for provider in list(index[user_id]):
+            if not Path(index[user_id][provider]['path']).exists():
+                del index[user_id][provider]
+                removed += 1
+        if not index[user_id]:
+            del index[user_id]
+    known = {Path(entry['path']).resolve() for user in index.values() for entry in user.values()}
+    for file in PAY_DIR.glob('*/*'):
+        if file.is_file() and file.resolve() not in known:
+            file.unlink()
+            removed += 1
+    save()
+    return removed
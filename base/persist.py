@@ -0,0 +1,73 @@
+"""
+Write-behind persistence for small JSON state files.
+save() only remembers the latest state of a file; all pending files are written together
+COALESCE seconds later, atomically (temp file + rename) in a dedicated writer thread.
+flush() writes everything still pending, and is called on shutdown.
+"""
+
+import asyncio
+import atexit
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+COALESCE = 1.0  # seconds
+
+_pending: dict[str, tuple[Any, dict]] = {}
+_timer: Optional[asyncio.TimerHandle] = None
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='persist')
+
+
+def write_atomic(path: str, text: str) -> None:
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as file:
+        file.write(text)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp, path)
+
+
+def _write_all(items: list[tuple[str, str]]) -> None:
+    for path, text in items:
+        write_atomic(path, text)
+
+
+def _snapshot() -> list[tuple[str, str]]:
+    """Serialize the pending states, on the caller's thread."""
+    items = [(path, json.dumps(obj, **kwargs)) for path, (obj, kwargs) in _pending.items()]
+    _pending.clear()
+    return items
+
+
+def save(path: str, obj: Any, **kwargs) -> None:
+    """
+    Schedule `obj` to be dumped to `path` as JSON, `kwargs` are passed to json.dumps.
+    The object is serialized when written, so later changes to it are picked up.
+    """
+    global _timer
+    _pending[path] = (obj, kwargs)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _write_all(_snapshot())
+        return
+    if _timer is None:
+        _timer = loop.call_later(COALESCE, lambda: asyncio.ensure_future(flush()))
+
+
+async def flush() -> None:
+    """Write all pending states now."""
+    global _timer
+    if _timer is not None:
+        _timer.cancel()
+        _timer = None
+    items = _snapshot()
+    if items:
+        await asyncio.get_running_loop().run_in_executor(_writer, _write_all, items)
+
+
+@atexit.register
+def _flush_at_exit() -> None:
+    _writer.shutdown(wait=True)
+    _write_all(_snapshot())
@@ -5,8 +5,11 @@ from datetime import datetime, timedelta
 from telegram import Message
 from telegram.ext import ContextTypes
 
+from base import persist
 from base.config import group
+from base.job import tracked_job
 from base.log import logger
+from base.metrics import Gauge
 
 try:
     with open('data/msgpool.json', 'r') as file:
@@ -16,12 +19,15 @@ try:
 except:
     msg_pool = []
 
+Gauge('bot_msg_pool_size', 'Messages waiting to be auto-deleted').set_function(lambda: len(msg_pool))
+
 
 def add_pool(msg: Message) -> None:
     if msg.chat.id == group:
         msg_pool.append((msg.date, msg.chat.id, msg.message_id))
 
 
+@tracked_job
 async def auto_delete(context: ContextTypes.DEFAULT_TYPE) -> None:
     tot = 0
     for x in msg_pool:
@@ -36,5 +42,4 @@ async def auto_delete(context: ContextTypes.DEFAULT_TYPE) -> None:
         else:
             break
     del msg_pool[:tot]
-    with open('data/msgpool.json', 'w') as file:
-        json.dump(msg_pool, file, default=str)
+    persist.save('data/msgpool.json', msg_pool, default=str)
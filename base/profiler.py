@@ -0,0 +1,49 @@
+"""
+In-process sampling profiler.
+A helper thread periodically grabs the stack of the target thread through sys._current_frames(),
+the samples are aggregated as collapsed stacks (`frame;frame;frame count`), the input format of flamegraph.pl and speedscope.
+"""
+
+import os
+import sys
+import time
+from collections import Counter
+from types import FrameType
+from typing import Optional
+
+
+def frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f'{os.path.basename(code.co_filename)}:{code.co_name}'
+
+
+def collapse(frame: Optional[FrameType]) -> str:
+    """Stack of a frame from the outermost call to the innermost one."""
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def thread_frame(thread_id: int) -> Optional[FrameType]:
+    return sys._current_frames().get(thread_id)
+
+
+def sample_stacks(thread_id: int, seconds: float, interval: float = 0.005) -> Counter[str]:
+    """
+    Sample the stack of a thread for `seconds`, blocking the calling thread.
+    """
+    stacks: Counter[str] = Counter()
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        frame = thread_frame(thread_id)
+        if frame is not None:
+            stacks[collapse(frame)] += 1
+        del frame
+        time.sleep(interval)
+    return stacks
+
+
+def collapsed(stacks: Counter[str]) -> str:
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
@@ -18,19 +18,26 @@ def sentry_init():
     if 'SENTRY' not in config or config['SENTRY'].get('dsn') is None:
         return
 
+    # 生产环境可以调低采样率，关闭持续 profiling，需要时用 /profile 现场采样
+    section = config['SENTRY']
+    continuous = section.getboolean('continuous_profiling', fallback=True)
+    options = {}
+    if not continuous:
+        options['profiles_sample_rate'] = section.getfloat('profiles_sample_rate', fallback=0.0)
     sentry_sdk.init(
-        dsn=config['SENTRY']['dsn'],
+        dsn=section['dsn'],
         release=datetime.now().strftime('%Y-%m-%d'),
         attach_stacktrace=True,
         # Set traces_sample_rate to 1.0 to capture 100%
         # of transactions for tracing.
-        traces_sample_rate=1.0,
+        traces_sample_rate=section.getfloat('traces_sample_rate', fallback=1.0),
         _experiments={
             # Set continuous_profiling_auto_start to True
             # to automatically start the profiler on when
             # possible.
-            "continuous_profiling_auto_start": True,
+            "continuous_profiling_auto_start": continuous,
         },
+        **options,
     )
 
     shlr = SentryHandler()
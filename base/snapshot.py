@@ -0,0 +1,58 @@
+"""
+Warm restarts: volatile in-memory state is saved to data/snapshot.json on shutdown and periodically,
+and put back at startup before the jobs begin.
+A module registers a section with a function returning its state as JSON-able data,
+and a function taking that data and the seconds elapsed since it was saved.
+"""
+
+import json
+import time
+import traceback
+from typing import Any, Callable
+
+from telegram.ext import ContextTypes
+
+from base import persist
+from base.job import tracked_job
+from base.log import logger
+
+PATH = 'data/snapshot.json'
+
+_sections: dict[str, tuple[Callable[[], Any], Callable[[Any, float], None]]] = {}
+
+
+def register(name: str, dump: Callable[[], Any], load: Callable[[Any, float], None]) -> None:
+    _sections[name] = (dump, load)
+
+
+def save() -> None:
+    state = {}
+    for name, (dump, _) in _sections.items():
+        try:
+            state[name] = dump()
+        except Exception as e:
+            logger.error(f'snapshot {name}: {e}')
+    persist.save(PATH, {'time': time.time(), 'state': state}, ensure_ascii=False)
+
+
+def restore() -> None:
+    try:
+        with open(PATH, 'r') as file:
+            snapshot = json.load(file)
+    except Exception:
+        return
+    elapsed = max(0.0, time.time() - snapshot['time'])
+    for name, data in snapshot['state'].items():
+        if name not in _sections:
+            continue
+        try:
+            _sections[name][1](data, elapsed)
+        except Exception as e:
+            logger.error(f'restore {name}: {e}')
+            logger.debug(traceback.format_exc())
+    logger.info(f'restored {", ".join(snapshot["state"])} saved {elapsed:.0f}s ago')
+
+
+@tracked_job
+async def save_snapshot(context: ContextTypes.DEFAULT_TYPE) -> None:
+    save()
@@ -0,0 +1,111 @@
+"""
+Event loop lag monitor.
+A task sleeps INTERVAL seconds in a loop and records how late it wakes up.
+A helper thread watches the task's heartbeat; once the loop has been stuck for longer than the threshold,
+it captures the stack of the loop thread, and the lag is charged to the innermost frame in this repo.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from types import FrameType
+from typing import Optional
+
+from base.config import lagThreshold
+from base.log import logger
+from base.profiler import collapse, thread_frame
+
+INTERVAL = 0.1  # seconds
+ROOT = str(Path(__file__).resolve().parent.parent)
+
+
+def culprit(frame: Optional[FrameType]) -> str:
+    """The innermost frame in this repo, or the innermost frame if none."""
+    innermost = frame
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(ROOT) and not filename.endswith('watchdog.py'):
+            return f'{Path(filename).relative_to(ROOT)}:{frame.f_code.co_name}'
+        frame = frame.f_back
+    if innermost is None:
+        return 'unknown'
+    return f'{Path(innermost.f_code.co_filename).name}:{innermost.f_code.co_name}'
+
+
+class LoopWatchdog:
+    def __init__(self, threshold: float = lagThreshold, history: int = 6000):
+        self.threshold = threshold
+        self.lags: deque[float] = deque(maxlen=history)
+        self.offenders: dict[str, list] = {}  # culprit -> [count, total lag, max lag]
+        self.beat = time.monotonic()
+        self.captured: Optional[tuple[float, str, str]] = None  # (heartbeat, culprit, stack) of the last stall
+        self.loop_thread = 0
+        self.task: Optional[asyncio.Task] = None
+        self.running = False
+
+    def start(self) -> None:
+        self.loop_thread = threading.get_ident()
+        self.running = True
+        self.task = asyncio.create_task(self.measure())
+        threading.Thread(target=self.watch, name='watchdog', daemon=True).start()
+
+    async def stop(self) -> None:
+        self.running = False
+        if self.task is not None:
+            self.task.cancel()
+
+    async def measure(self) -> None:
+        while self.running:
+            self.beat = start = time.monotonic()
+            await asyncio.sleep(INTERVAL)
+            lag = time.monotonic() - start - INTERVAL
+            self.lags.append(lag)
+            if lag >= self.threshold:
+                self.charge(start, lag)
+
+    def charge(self, beat: float, lag: float) -> None:
+        captured = self.captured
+        name, stack = 'unknown', ''
+        if captured is not None and captured[0] == beat:
+            _, name, stack = captured
+        entry = self.offenders.setdefault(name, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += lag
+        entry[2] = max(entry[2], lag)
+        logger.warning(f'event loop blocked for {lag:.3f}s by {name}')
+        logger.debug(f'blocking stack: {stack}')
+
+    def watch(self) -> None:
+        # 在阻塞达到阈值之前就抓取调用栈
+        stalled = None
+        while self.running:
+            time.sleep(min(INTERVAL, self.threshold / 4))
+            beat = self.beat
+            if time.monotonic() - beat > INTERVAL + self.threshold / 2 and stalled != beat:
+                stalled = beat
+                frame = thread_frame(self.loop_thread)
+                self.captured = (beat, culprit(frame), collapse(frame))
+                del frame
+
+    def percentiles(self, ps=(50, 90, 99)) -> dict[int, float]:
+        lags = sorted(self.lags)
+        if not lags:
+            return {p: 0.0 for p in ps}
+        return {p: lags[min(len(lags) - 1, len(lags) * p // 100)] for p in ps}
+
+    def report(self, top: int = 10) -> str:
+        pct = self.percentiles()
+        lines = ['Loop lag (%d samples): %s, max %.1fms' % (
+            len(self.lags), ', '.join(f'p{p} {v*1000:.1f}ms' for p, v in pct.items()),
+            max(self.lags, default=0) * 1000)]
+        worst = sorted(self.offenders.items(), key=lambda x: x[1][1], reverse=True)[:top]
+        if worst:
+            lines.append(f'Blocked >= {self.threshold*1000:.0f}ms:')
+        for name, (count, total, longest) in worst:
+            lines.append(f'{name}: {count}x, total {total:.2f}s, max {longest:.2f}s')
+        return '\n'.join(lines)
+
+
+watchdog = LoopWatchdog()
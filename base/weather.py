@@ -1,9 +1,14 @@
 import json
+import time
+from typing import Optional
 
 import aiohttp
 
 from base.config import caiyunToken
-from base.network import attempt
+from base.metrics import Counter
+from base.network import ErrorAfterAttempts, attempt
+
+fetches = Counter('bot_caiyun_fetches_total', 'Caiyun API fetches, by outcome', ('outcome',))
 
 # ==================== function ====================
 
@@ -184,6 +189,39 @@ def alert_now(data: dict) -> list[str]:
                   for each in data['content'] if each['request_status'] == 'ok']
     return alerts
 
+# ==================== nowcast ====================
+
+
+def data_age(data: dict, now: Optional[float] = None) -> float:
+    """数据获取后经过的秒数"""
+    now = time.time() if now is None else now
+    return max(0.0, now - data.get('server_time', now))
+
+
+def nowcast(data: dict, now: Optional[float] = None) -> dict:
+    """
+    按数据获取后经过的时间平移分钟级预报，作为当前时刻的预报
+    precipitation_2h 与 precipitation 去掉已经过去的分钟，末尾用最后一个值补齐；probability 每 30 分钟一档，同样平移
+    超过两小时的数据已没有预报可用，返回 {}
+    """
+    if data == {} or data['result']['minutely']['status'] != 'ok':
+        return data
+    minutes = int(data_age(data, now) // 60)
+    if minutes == 0:
+        return data
+    if minutes >= 120:
+        return {}
+
+    def shift(series: list, n: int) -> list:
+        n = min(n, len(series) - 1)
+        return series[n:] + series[-1:] * n
+
+    minutely = dict(data['result']['minutely'])
+    minutely['precipitation_2h'] = shift(minutely['precipitation_2h'], minutes)
+    minutely['precipitation'] = shift(minutely['precipitation'], minutes)
+    minutely['probability'] = shift(minutely['probability'], minutes // 30)
+    return dict(data, result=dict(data['result'], minutely=minutely))
+
 # ==================== weather ====================
 
 
@@ -332,7 +370,13 @@ async def caiyun_api(longitude, latitude):
     """
     url = 'https://api.caiyunapp.com/v2.6/%s/%s,%s/weather.json?lang=zh_CN&alert=true' % (
         caiyunToken, longitude, latitude)
-    data = await caiyun_api_get(url)
+    try:
+        data = await caiyun_api_get(url)
+    except ErrorAfterAttempts:
+        fetches.labels('network_error').inc()
+        raise
     if data.get('status') != 'ok':
+        fetches.labels('api_error').inc()
         raise CaiyunAPIError(f'彩云天气 API 返回错误: {json.dumps(data)}')
+    fetches.labels('ok').inc()
     return data
@@ -1,53 +1,66 @@
 import binascii
+import functools
 import re
+from typing import Iterable
 
 from Crypto.Cipher import AES
 
+encryStr = b'wrdvpnisthebest!'
+encryHex = bytes.decode(binascii.b2a_hex(encryStr))
 
-def webvpn(url):
+hexPrefix = re.compile('[0-9a-fA-F:]+')
 
-    encryStr = b'wrdvpnisthebest!'
 
-    def encrypt(url):
-        url = str.encode(url)
-        cryptor = AES.new(encryStr, AES.MODE_CFB, encryStr, segment_size=16*8)
+@functools.lru_cache(maxsize=1024)
+def encrypt(host: str) -> str:
+    """
+    Encrypt the host part of a url.
+    The key and IV are fixed, so the result only depends on the host and can be cached.
+    """
+    cryptor = AES.new(encryStr, AES.MODE_CFB, encryStr, segment_size=16*8)
+    return encryHex + bytes.decode(binascii.b2a_hex(cryptor.encrypt(str.encode(host))))
 
-        return bytes.decode(binascii.b2a_hex(encryStr)) + \
-            bytes.decode(binascii.b2a_hex(cryptor.encrypt(url)))
 
-    if url[0:7] == 'http://':
+def webvpn(url: str) -> str:
+    if url.startswith('http://'):
         url = url[7:]
         protocol = 'http'
-    elif url[0:8] == 'https://':
+    elif url.startswith('https://'):
         url = url[8:]
         protocol = 'https'
+    else:
+        raise ValueError(f'Unsupported url: {url}')
 
-    v6 = re.match('[0-9a-fA-F:]+', url)
-    if v6 != None:
+    v6 = hexPrefix.match(url)
+    if v6 is not None:
         v6 = v6.group(0)
         url = url[len(v6):]
 
-    segments = url.split('?')[0].split(':')
+    segments = url.split('?', 1)[0].split(':')
     port = None
     if len(segments) > 1:
-        port = segments[1].split('/')[0]
-        url = url[0: len(segments[0])] + url[len(segments[0]) + len(port) + 1:]
-
-    try:
-        idx = url.index('/')
-        host = url[0: idx]
-        path = url[idx:]
-        if v6 != None:
-            host = v6
-        url = encrypt(host) + path
-    except:
-        if v6 != None:
-            url = v6
-        url = encrypt(url)
-
-    if port != None:
-        url = 'https://webvpn.tsinghua.edu.cn/' + protocol + '-' + port + '/' + url
+        port = segments[1].split('/', 1)[0]
+        url = url[:len(segments[0])] + url[len(segments[0]) + len(port) + 1:]
+
+    idx = url.find('/')
+    if idx >= 0:
+        url = encrypt(v6 if v6 is not None else url[:idx]) + url[idx:]
     else:
-        url = 'https://webvpn.tsinghua.edu.cn/' + protocol + '/' + url
+        url = encrypt(v6 if v6 is not None else url)
+
+    if port is not None:
+        return 'https://webvpn.tsinghua.edu.cn/' + protocol + '-' + port + '/' + url
+    return 'https://webvpn.tsinghua.edu.cn/' + protocol + '/' + url
+
 
-    return url
+def webvpn_batch(urls: Iterable[str]) -> list[str]:
+    """
+    Convert many urls at once, each distinct url is converted only once.
+    """
+    done: dict[str, str] = {}
+    ret = []
+    for url in urls:
+        if url not in done:
+            done[url] = webvpn(url)
+        ret.append(done[url])
+    return ret
@@ -0,0 +1,99 @@
+"""
+A local stand-in for the Telegram Bot API, for the load harness.
+Every method succeeds with a plausible result after an optional delay, and the calls are counted.
+"""
+
+import asyncio
+import io
+import itertools
+import json
+import time
+from collections import Counter
+
+import qrcode
+from aiohttp import web
+
+BOT = {'id': 1, 'is_bot': True, 'first_name': 'Replay', 'username': 'replay_bot',
+       'can_join_groups': True, 'can_read_all_group_messages': False, 'supports_inline_queries': False}
+PAYCODE = 'wxp://f2f0replayreplayreplayreplayreplay'
+
+
+def paycode_png() -> bytes:
+    buf = io.BytesIO()
+    qrcode.make(PAYCODE).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Counter[str] = Counter()
+        self.message_ids = itertools.count(1000)
+        self.photo = paycode_png()
+        self.runner: web.AppRunner | None = None
+        self.port = 0
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.port}/bot'
+
+    @property
+    def base_file_url(self) -> str:
+        return f'http://127.0.0.1:{self.port}/file/bot'
+
+    async def start(self) -> None:
+        app = web.Application(client_max_size=64 * 2**20)
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        app.router.add_get('/file/bot{token}/{path:.*}', self.download)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]  # type: ignore
+
+    async def stop(self) -> None:
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    def message(self, chat_id, **fields) -> dict:
+        chat_id = int(chat_id)
+        chat = {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup'}
+        return {'message_id': next(self.message_ids), 'date': int(time.time()), 'chat': chat,
+                'from': BOT, **fields}
+
+    def photo_sizes(self) -> list[dict]:
+        file_id = f'replay{next(self.message_ids)}'
+        return [{'file_id': file_id, 'file_unique_id': file_id, 'width': 290, 'height': 290,
+                 'file_size': len(self.photo)}]
+
+    def result(self, method: str, params: dict):
+        chat_id = params.get('chat_id', 1)
+        match method:
+            case 'getMe':
+                return BOT
+            case 'sendMessage' | 'editMessageText':
+                return self.message(chat_id, text=params.get('text', ''))
+            case 'sendPhoto' | 'editMessageMedia':
+                return self.message(chat_id, photo=self.photo_sizes())
+            case 'sendMediaGroup':
+                return [self.message(chat_id, photo=self.photo_sizes())
+                        for _ in json.loads(params['media'])]
+            case 'getFile':
+                return {'file_id': params['file_id'], 'file_unique_id': params['file_id'],
+                        'file_size': len(self.photo), 'file_path': f'photos/{params["file_id"]}.png'}
+            case _:
+                return True
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] += 1
+        params = dict(await request.post())
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        return web.json_response({'ok': True, 'result': self.result(method, params)})
+
+    async def download(self, request: web.Request) -> web.Response:
+        self.calls['download'] += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        return web.Response(body=self.photo, content_type='image/png')
@@ -0,0 +1,46 @@
+"""
+Fixtures for the benchmarks: recorded Caiyun responses and synthetic info posts.
+"""
+
+import json
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from pytz import timezone
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+
+SOURCES = ['教务处', '研究生院', '学生部', '图书馆', '后勤', '保卫处', '校团委', '信息化技术中心']
+TOPICS = ['期末考试安排', '选课', '奖学金评定', '闭馆', '停水停电', '网络维护', '讲座', '招聘', '体测', '校历调整']
+
+
+def caiyun(name: str = 'caiyun_rain') -> dict:
+    """
+    A recorded Caiyun response, with its hourly series moved to start at the current hour
+    so that the charts have data to draw.
+    """
+    data = json.loads((FIXTURES / f'{name}.json').read_text())
+    now = datetime.now(timezone('Asia/Shanghai')).replace(minute=0, second=0, microsecond=0)
+    hourly = data['result']['hourly']
+    for series in hourly.values():
+        if isinstance(series, list):
+            for i, x in enumerate(series):
+                x['datetime'] = (now + timedelta(hours=i)).isoformat(timespec='minutes')
+    for i, x in enumerate(hourly['air_quality']['aqi']):
+        x['datetime'] = (now + timedelta(hours=i)).isoformat(timespec='minutes')
+    data['server_time'] = int(now.timestamp())
+    return data
+
+
+def info_posts(n: int, seed: int = 0) -> list[dict]:
+    """Synthetic `newinfo` posts as they arrive from the pipe."""
+    rd = random.Random(seed)
+    posts = []
+    for i in range(n):
+        source = rd.choice(SOURCES)
+        title = f'关于{rd.randint(2020, 2025)}年{rd.choice(["春季", "秋季", "夏季"])}学期{rd.choice(TOPICS)}的通知（{i}）'
+        url = f'https://info.tsinghua.edu.cn/f/info/xxfb_fg/xnzx/template/detail?xxid={rd.getrandbits(64):016x}'
+        posts.append({'type': 'newinfo', 'data': {'source': source, 'title': title, 'url': url}})
+    return posts
+
@@ -0,0 +1,120 @@
+"""
+Compare the default asyncio event loop with uvloop on the offline workload:
+the replay harness with updates delivered through the webhook server, and the base.network helpers
+against a local HTTP server. Each loop runs in its own process.
+
+    python -m benchmark.loops
+    python -m benchmark.loops --duration 30 --requests 5000
+
+Run it from the repository root with a config.ini, see benchmark/replay.py.
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+LOOPS = ('asyncio', 'uvloop')
+
+
+async def network_bench(requests: int, concurrency: int) -> float:
+    """Requests per second of base.network.get_dict against a local server."""
+    from aiohttp import web
+
+    from base import network
+    from benchmark.replay import free_port
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.json_response({'status': 'ok', 'result': list(range(100))})
+
+    app = web.Application()
+    app.router.add_get('/', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    port = free_port()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        async with semaphore:
+            await network.get_dict(f'http://127.0.0.1:{port}/')
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    await runner.cleanup()
+    return requests / elapsed
+
+
+def child(args: argparse.Namespace) -> None:
+    # benchmark.replay moves to a scratch directory before the bot's modules are imported
+    from benchmark.replay import DEFAULT_MIX, replay
+    from bot import install_uvloop
+
+    if args.child == 'uvloop' and not install_uvloop():
+        Path(args.out).write_text(json.dumps({'error': 'uvloop is not installed'}))
+        return
+
+    async def run() -> dict:
+        result = {'loop': type(asyncio.get_running_loop()).__module__.split('.')[0],
+                  'network': await network_bench(args.requests, args.concurrency)}
+        result.update(await replay(DEFAULT_MIX, args.duration, args.api_latency, webhook=True))
+        return result
+
+    Path(args.out).write_text(json.dumps(asyncio.run(run())))
+
+
+def compare(results: dict[str, dict]) -> None:
+    names = list(results)
+    print(f'{"":>28}' + ''.join(f'{name:>12}' for name in names))
+    rows = [('event loop', [x['loop'] for x in results.values()]),
+            ('network get_dict (req/s)', [f'{x["network"]:.0f}' for x in results.values()]),
+            ('updates handled (/s)', [f'{x["throughput"]:.1f}' for x in results.values()])]
+    handlers = sorted(set().union(*(x['handlers'] for x in results.values())))
+    for handler in handlers:
+        for p in ('p50', 'p99'):
+            rows.append((f'{handler} {p} (ms)', [
+                f'{x["handlers"][handler][f"{p}_ms"]:.1f}' if handler in x['handlers'] else '-'
+                for x in results.values()]))
+    for label, values in rows:
+        print(f'{label:>28}' + ''.join(f'{value:>12}' for value in values))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=10, help='seconds of replayed updates per loop')
+    parser.add_argument('--requests', type=int, default=2000, help='requests for the network helpers')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--api-latency', type=float, default=0.0, help='seconds each Bot API call takes')
+    parser.add_argument('--child', choices=LOOPS, help=argparse.SUPPRESS)
+    parser.add_argument('--out', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    results = {}
+    for loop in LOOPS:
+        with tempfile.NamedTemporaryFile(suffix='.json') as out:
+            print(f'running on {loop}...', file=sys.stderr)
+            subprocess.run([sys.executable, '-m', 'benchmark.loops', '--child', loop, '--out', out.name,
+                            '--duration', str(args.duration), '--requests', str(args.requests),
+                            '--concurrency', str(args.concurrency), '--api-latency', str(args.api_latency)],
+                           cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+            result = json.loads(Path(out.name).read_text() or '{"error": "no result"}')
+        if 'error' in result:
+            print(f'{loop}: {result["error"]}', file=sys.stderr)
+            continue
+        results[loop] = result
+    compare(results)
+
+
+if __name__ == '__main__':
+    main()
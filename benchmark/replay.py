@@ -0,0 +1,331 @@
+"""
+Offline load harness: replays synthetic updates through the same Application as bot.main(),
+against a local fake Bot API server, and reports per-handler latency and the outbound API calls.
+
+    python -m benchmark.replay                                  # the default mix for 10 seconds
+    python -m benchmark.replay --duration 30 --rate roll=50 --rate forecast=2
+    python -m benchmark.replay --api-latency 0.05 --caiyun-latency 0.3
+    python -m benchmark.replay --webhook                        # POST the updates to the webhook server
+
+Rates are updates per second for each kind of update, see KINDS.
+Run it from the repository root with a config.ini; the bot's state files are written to a temporary directory
+and nothing goes to the network (Caiyun and the heartbeat are replaced with fixtures).
+"""
+
+import argparse
+import asyncio
+import atexit
+import functools
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Awaitable, Callable
+
+import aiohttp
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+workdir = Path(tempfile.mkdtemp(prefix='replay_'))
+# registered before the bot's modules, so it runs after their own exit hooks have flushed
+atexit.register(shutil.rmtree, workdir, ignore_errors=True)
+shutil.copy(ROOT / 'config.ini', workdir)
+(workdir / 'template').symlink_to(ROOT / 'template')
+for folder in ('data', 'tmp', 'log'):
+    (workdir / folder).mkdir()
+os.chdir(workdir)
+
+from telegram import Update  # noqa: E402
+from telegram.ext import Application, TypeHandler  # noqa: E402
+
+import command.weather as weather  # noqa: E402
+from base import network  # noqa: E402
+from base.config import group, pipe  # noqa: E402
+from benchmark.fakeapi import FakeBotAPI  # noqa: E402
+from benchmark.fixtures import caiyun, info_posts  # noqa: E402
+from bot import build_app  # noqa: E402
+
+TOKEN = '123456:replay'
+SECRET = 'replay'
+
+DEFAULT_MIX = {'roll': 20, 'callpolice': 2, 'yue': 2, 'fan': 1, 'weather': 1, 'forecast': 0.5,
+               'register': 0.5, 'info': 5, 'payme_upload': 0.2}
+
+# the repeating jobs, their first runs come only a minute after start
+TICK_JOBS = ('weather_poll', 'send_heartbeat', 'auto_delete')
+
+update_ids = itertools.count(1)
+message_ids = itertools.count(1)
+rd = random.Random(0)
+
+
+def user(user_id: int) -> dict:
+    return {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}', 'username': f'user{user_id}'}
+
+
+def command(text: str, chat_id: int, user_id: int) -> dict:
+    cmd = text.split()[0]
+    chat = {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup'}
+    return {'message': {'message_id': next(message_ids), 'date': int(time.time()), 'chat': chat,
+                        'from': user(user_id), 'text': text,
+                        'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(cmd)}]}}
+
+
+def channel_post(text: str) -> dict:
+    return {'channel_post': {'message_id': next(message_ids), 'date': int(time.time()),
+                             'chat': {'id': pipe, 'type': 'channel', 'title': 'pipe'}, 'text': text}}
+
+
+def private_photo(user_id: int) -> dict:
+    file_id = f'upload{next(message_ids)}'
+    sizes = [{'file_id': f'{file_id}_{side}', 'file_unique_id': f'{file_id}_{side}', 'width': side, 'height': side}
+             for side in (90, 320, 800)]
+    return {'message': {'message_id': next(message_ids), 'date': int(time.time()),
+                        'chat': {'id': user_id, 'type': 'private'}, 'from': user(user_id), 'photo': sizes}}
+
+
+posts = (json.dumps(post, ensure_ascii=False) for post in info_posts(20000))
+
+# kind -> function building the body of an update
+KINDS: dict[str, Callable[[], dict]] = {
+    'roll': lambda: command('/roll 100', group, rd.randint(1, 50)),
+    'callpolice': lambda: command('/callpolice', group, rd.randint(1, 50)),
+    'yue': lambda: command('/yue', group, rd.randint(1, 50)),
+    'fan': lambda: command('/fan', group, rd.randint(1, 50)),
+    'weather': lambda: command('/weather', group, rd.randint(1, 50)),
+    'forecast': lambda: command('/forecast', group, rd.randint(1, 50)),
+    'register': lambda: command('/register 1994990239 202102', rd.randint(1, 50), rd.randint(1, 50)),
+    'search': lambda: command('/search 考试', group, rd.randint(1, 50)),
+    'info': lambda: channel_post(next(posts)),
+    'payme_upload': lambda: private_photo(rd.randint(1, 50)),
+}
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class Recorder:
+    """Latency of each handler, from the update being queued to the handler returning."""
+
+    def __init__(self):
+        self.queued: dict[int, float] = {}
+        self.latency: dict[str, list[float]] = defaultdict(list)
+        self.service: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    def record(self, name: str, queued: float, start: float, failed: bool) -> None:
+        end = time.perf_counter()
+        self.latency[name].append(end - queued)
+        self.service[name].append(end - start)
+        if failed:
+            self.errors[name] += 1
+
+    def timed_handler(self, name: str, callback):
+        @functools.wraps(callback)
+        async def wrap(update: Update, context):
+            start = time.perf_counter()
+            failed = True
+            try:
+                ret = await callback(update, context)
+                failed = False
+                return ret
+            finally:
+                self.record(name, self.queued.get(update.update_id, start), start, failed)
+        return wrap
+
+    def timed_job(self, name: str, callback):
+        @functools.wraps(callback)
+        async def wrap(context):
+            start = time.perf_counter()
+            failed = True
+            try:
+                ret = await callback(context)
+                failed = False
+                return ret
+            finally:
+                self.record(name, start, start, failed)
+        return wrap
+
+    async def done(self, update: Update, context) -> None:
+        self.queued.pop(update.update_id, None)
+
+    def instrument(self, app: Application) -> None:
+        for handlers in app.handlers.values():
+            for handler in handlers:
+                handler.callback = self.timed_handler(handler.callback.__name__, handler.callback)
+        # the last group, runs after the handlers of every other group
+        app.add_handler(TypeHandler(Update, self.done), group=99)
+        assert app.job_queue
+        for job in app.job_queue.jobs():
+            job.callback = self.timed_job(f'job:{job.callback.__name__}', job.callback)
+
+    def report(self) -> dict[str, dict]:
+        return {name: {
+            'count': len(values),
+            'p50_ms': percentile(values, 50) * 1000,
+            'p90_ms': percentile(values, 90) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'max_ms': max(values) * 1000,
+            'service_ms': statistics.mean(self.service[name]) * 1000,
+            'errors': self.errors[name],
+        } for name, values in sorted(self.latency.items())}
+
+
+def offline(caiyun_latency: float) -> None:
+    """Replace the calls to the outside world."""
+    data = caiyun('caiyun_rain')
+
+    async def caiyun_api(longitude, latitude):
+        await asyncio.sleep(caiyun_latency)
+        return data
+
+    async def get(url, *args, **kwargs):
+        return b''
+
+    weather.caiyun_api = caiyun_api
+    network.get = get
+
+
+async def produce(send: Callable[[dict], Awaitable], recorder: Recorder, kind: str, rate: float,
+                  duration: float) -> int:
+    """Send updates of one kind at a fixed rate, return how many were sent."""
+    start = time.perf_counter()
+    count = 0
+    while (now := time.perf_counter()) - start < duration:
+        body = {'update_id': next(update_ids), **KINDS[kind]()}
+        recorder.queued[body['update_id']] = now
+        await send(body)
+        count += 1
+        await asyncio.sleep(max(0.0, start + count / rate - time.perf_counter()))
+    return count
+
+
+async def tick(app: Application, interval: float, duration: float) -> None:
+    """
+    Run the repeating jobs every `interval` seconds instead of every minute, each time with a Caiyun fetch.
+    Runs are started without waiting for the previous ones, as the JobQueue does.
+    """
+    assert app.job_queue
+    jobs = [job for job in app.job_queue.jobs() if job.name in TICK_JOBS]
+    start = time.perf_counter()
+    tasks = []
+    while time.perf_counter() - start < duration:
+        weather.remain_minutes = 0
+        tasks += [asyncio.create_task(job.run(app)) for job in jobs]
+        await asyncio.sleep(interval)
+    await asyncio.gather(*tasks)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def replay(mix: dict[str, float], duration: float, api_latency: float = 0.0,
+                 caiyun_latency: float = 0.0, job_interval: float = 1.0, webhook: bool = False) -> dict:
+    """
+    Run the workload, return the throughput, per-handler latency and the outbound API calls.
+    With `webhook`, updates are POSTed to the Updater's webhook server as Telegram does,
+    otherwise they are put straight into the update queue.
+    """
+    offline(caiyun_latency)
+    api = FakeBotAPI(api_latency)
+    await api.start()
+    builder = Application.builder().token(TOKEN).base_url(api.base_url).base_file_url(api.base_file_url)
+    app = build_app(builder if webhook else builder.updater(None))
+    recorder = Recorder()
+    recorder.instrument(app)
+    session = aiohttp.ClientSession()
+    try:
+        await app.initialize()
+        if webhook:
+            assert app.updater
+            port = free_port()
+            await app.updater.start_webhook(listen='127.0.0.1', port=port, url_path='webhook',
+                                            secret_token=SECRET)
+
+            async def send(body: dict) -> None:
+                async with session.post(f'http://127.0.0.1:{port}/webhook', json=body,
+                                        headers={'X-Telegram-Bot-Api-Secret-Token': SECRET}) as r:
+                    assert r.status == 200, r.status
+        else:
+            async def send(body: dict) -> None:
+                await app.update_queue.put(Update.de_json(body, app.bot))
+        await app.start()
+        start = time.perf_counter()
+        ticking = asyncio.create_task(tick(app, job_interval, duration)) if job_interval > 0 else None
+        counts = await asyncio.gather(*(produce(send, recorder, kind, rate, duration)
+                                        for kind, rate in mix.items() if rate > 0))
+        if ticking is not None:
+            await ticking
+        while recorder.queued and time.perf_counter() - start < duration * 10:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        if app.updater and app.updater.running:
+            await app.updater.stop()
+        await app.stop()
+        await app.shutdown()
+    finally:
+        await session.close()
+        await api.stop()
+    return {
+        'updates': sum(counts),
+        'unfinished': len(recorder.queued),
+        'elapsed': elapsed,
+        'throughput': (sum(counts) - len(recorder.queued)) / elapsed,
+        'handlers': recorder.report(),
+        'calls': dict(api.calls.most_common()),
+    }
+
+
+def print_result(result: dict) -> None:
+    print(f'{result["updates"]} updates in {result["elapsed"]:.1f}s, {result["throughput"]:.1f}/s, '
+          f'{result["unfinished"]} unfinished')
+    print(f'{"handler":>22} {"count":>6} {"p50":>9} {"p90":>9} {"p99":>9} {"max":>9} {"service":>9} {"errors":>6}')
+    for name, x in result['handlers'].items():
+        print(f'{name:>22} {x["count"]:6d} {x["p50_ms"]:9.1f} {x["p90_ms"]:9.1f} {x["p99_ms"]:9.1f} '
+              f'{x["max_ms"]:9.1f} {x["service_ms"]:9.1f} {x["errors"]:6d}')
+    print('outbound calls: ' + ', '.join(f'{method} {count}' for method, count in result['calls'].items()))
+
+
+def parse_mix(rates: list[str]) -> dict[str, float]:
+    mix = {}
+    for rate in rates:
+        kind, value = rate.split('=')
+        if kind not in KINDS:
+            raise SystemExit(f'unknown kind {kind}, choose from {", ".join(KINDS)}')
+        mix[kind] = float(value)
+    return mix
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=10, help='seconds to produce updates for')
+    parser.add_argument('--rate', action='append', default=[], metavar='KIND=N',
+                        help='updates per second of a kind, replaces the default mix')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='seconds each Bot API call takes')
+    parser.add_argument('--caiyun-latency', type=float, default=0.0, help='seconds each Caiyun fetch takes')
+    parser.add_argument('--job-interval', type=float, default=1.0,
+                        help='seconds between runs of the repeating jobs, 0 to leave them to the JobQueue')
+    parser.add_argument('--webhook', action='store_true', help='deliver the updates through the webhook server')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.rate) if args.rate else DEFAULT_MIX
+    print_result(asyncio.run(replay(mix, args.duration, args.api_latency, args.caiyun_latency,
+                                    args.job_interval, args.webhook)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Benchmark suite for the bot's hot functions.
+
+    python -m benchmark.run                   # run and print
+    python -m benchmark.run --save            # also write the results as the baseline
+    python -m benchmark.run --compare         # compare with the baseline, exit 1 on regressions
+    python -m benchmark.run -k graph          # only the benchmarks whose name contains `graph`
+
+Run it from the repository root with a config.ini, like the bot itself.
+The bot's modules are imported in a temporary directory, so the files they open or write
+(state files, charts, info.db) never touch the real ./data.
+"""
+
+import argparse
+import asyncio
+import atexit
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+from typing import Callable
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE = ROOT / 'benchmark' / 'baseline.json'
+sys.path.insert(0, str(ROOT))
+
+cwd = Path.cwd()  # where relative --baseline paths are taken from
+workdir = Path(tempfile.mkdtemp(prefix='benchmark_'))
+# registered before the bot's modules, so it runs after their own exit hooks have flushed
+atexit.register(shutil.rmtree, workdir, ignore_errors=True)
+shutil.copy(ROOT / 'config.ini', workdir)
+(workdir / 'template').symlink_to(ROOT / 'template')
+for folder in ('data', 'tmp', 'log'):
+    (workdir / folder).mkdir()
+os.chdir(workdir)
+
+import base.infodb as infodb  # noqa: E402
+import command.weather as weather  # noqa: E402
+from base import message  # noqa: E402
+from base.format import escaped  # noqa: E402
+from base.weather import (daily_weather, level_windspeed,  # noqa: E402
+                          now_weather, wind_direction)
+from base.webvpn import webvpn  # noqa: E402
+from benchmark.fixtures import caiyun, info_posts  # noqa: E402
+from command.gadget import generator_register  # noqa: E402
+from command.info import daily_texts, info_daily  # noqa: E402
+
+benchmarks: dict[str, Callable[[], object]] = {}
+
+
+def bench(name: str):
+    def decorate(func):
+        benchmarks[name] = func
+        return func
+    return decorate
+
+
+class FakeMessage:
+    message_id = 1
+
+
+class FakeBot:
+    """Stands in for telegram.Bot, every call succeeds immediately."""
+
+    def __getattr__(self, name):
+        async def call(*args, **kwargs):
+            return FakeMessage()
+        return call
+
+
+loop = asyncio.new_event_loop()
+rain = caiyun('caiyun_rain')
+dry = caiyun('caiyun_dry')
+posts = info_posts(300)
+urls = [post['data']['url'] for post in posts]
+
+
+# ==================== weather ====================
+
+bench('daily_weather')(lambda: daily_weather(rain, 8))
+bench('daily_weather_night')(lambda: daily_weather(rain, 20))
+bench('now_weather')(lambda: now_weather(rain))
+bench('wind_direction')(lambda: wind_direction(203.0))
+bench('level_windspeed')(lambda: level_windspeed(12.6))
+
+
+@bench('forecast_rain')
+def _():
+    weather.caiyunData = rain
+    loop.run_until_complete(weather.forecast_rain(FakeBot()))  # type: ignore
+
+
+@bench('temperature_graph')
+def _():
+    weather.caiyunData = rain
+    weather.temperature_graph()
+
+
+@bench('precipitation_graph')
+def _():
+    weather.caiyunData = rain
+    weather.precipitation_graph()
+
+
+@bench('mixed_graph')
+def _():
+    weather.caiyunData = rain
+    weather.mixed_graph()
+
+
+@bench('mixed_graph_dry')
+def _():
+    weather.caiyunData = dry
+    weather.mixed_graph()
+
+
+# ==================== info ====================
+
+bench('webvpn')(lambda: [webvpn(url) for url in urls[:20]])
+bench('escaped')(lambda: [escaped(post['data']['title']) for post in posts[:20]])
+bench('info_daily')(lambda: info_daily())
+bench('daily_report_text')(lambda: daily_texts(info_daily()))
+
+
+# ==================== gadget ====================
+
+bench('generator_register')(lambda: generator_register('1994990239', '202102'))
+
+
+def setup() -> None:
+    """Keep the benchmarks away from the network, with a fixed set of info posts."""
+    message.init(FakeBot())  # type: ignore
+    infodb.connect(':memory:')
+    for post in posts:
+        infodb.add_info(post['data'], None)
+
+
+def measure(func: Callable[[], object], repeat: int = 5) -> dict:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    runs = [t / number * 1e6 for t in timer.repeat(repeat=repeat, number=number)]
+    return {'median_us': statistics.median(runs), 'min_us': min(runs), 'number': number}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['median_us'] / baseline[name]['median_us']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f'{name:>22}: {baseline[name]["median_us"]:12.2f} -> {result["median_us"]:12.2f} us  x{ratio:.2f}{flag}')
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', default='', help='only run benchmarks whose name contains this')
+    parser.add_argument('--save', action='store_true', help=f'write the results to {BASELINE.name}')
+    parser.add_argument('--compare', action='store_true', help=f'compare with {BASELINE.name}')
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown, 0.2 = 20%%')
+    args = parser.parse_args()
+    baseline_path = cwd / args.baseline
+    if args.compare and not baseline_path.exists():
+        sys.exit(f'{baseline_path} not found, run with --save first')
+
+    setup()
+    results = {}
+    for name, func in benchmarks.items():
+        if args.k in name:
+            results[name] = measure(func)
+            if not args.compare:
+                print(f'{name:>22}: {results[name]["median_us"]:12.2f} us')
+
+    if args.compare:
+        baseline = json.loads(baseline_path.read_text())
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+    if args.save:
+        baseline_path.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
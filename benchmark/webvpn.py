@@ -0,0 +1,105 @@
+"""
+WebVPN url encoder: correctness and speed against the previous implementation.
+
+    python -m benchmark.webvpn
+"""
+
+import binascii
+import re
+import timeit
+
+from Crypto.Cipher import AES
+
+from base.webvpn import encrypt, webvpn, webvpn_batch
+
+
+def webvpn_reference(url):
+    """The uncached implementation, kept verbatim as the reference."""
+
+    encryStr = b'wrdvpnisthebest!'
+
+    def encrypt(url):
+        url = str.encode(url)
+        cryptor = AES.new(encryStr, AES.MODE_CFB, encryStr, segment_size=16*8)
+
+        return bytes.decode(binascii.b2a_hex(encryStr)) + \
+            bytes.decode(binascii.b2a_hex(cryptor.encrypt(url)))
+
+    if url[0:7] == 'http://':
+        url = url[7:]
+        protocol = 'http'
+    elif url[0:8] == 'https://':
+        url = url[8:]
+        protocol = 'https'
+
+    v6 = re.match('[0-9a-fA-F:]+', url)
+    if v6 != None:
+        v6 = v6.group(0)
+        url = url[len(v6):]
+
+    segments = url.split('?')[0].split(':')
+    port = None
+    if len(segments) > 1:
+        port = segments[1].split('/')[0]
+        url = url[0: len(segments[0])] + url[len(segments[0]) + len(port) + 1:]
+
+    try:
+        idx = url.index('/')
+        host = url[0: idx]
+        path = url[idx:]
+        if v6 != None:
+            host = v6
+        url = encrypt(host) + path
+    except:
+        if v6 != None:
+            url = v6
+        url = encrypt(url)
+
+    if port != None:
+        url = 'https://webvpn.tsinghua.edu.cn/' + protocol + '-' + port + '/' + url
+    else:
+        url = 'https://webvpn.tsinghua.edu.cn/' + protocol + '/' + url
+
+    return url
+
+
+URLS = [
+    'https://info.tsinghua.edu.cn/f/info/xxfb_fg/xnzx/template/detail?xxid=1b5e4c1f',
+    'http://info.tsinghua.edu.cn',
+    'http://info.tsinghua.edu.cn/',
+    'https://www.tsinghua.edu.cn/info/1182/112233.htm',
+    'https://dean.tsinghua.edu.cn/notice/2024/exam.html',
+    'https://career.cic.tsinghua.edu.cn/xsglxt/f/jyxt/anony/xxfb',
+    'http://166.111.4.100:8080/path/to/page?q=1',
+    'http://166.111.4.100:8080',
+    'https://lib.tsinghua.edu.cn:443/news?id=5',
+    'http://[2402:f000:1:404:166:111:4:100]/index.html',
+    'http://2402:f000::1/index.html',
+    'https://ecard.tsinghua.edu.cn?from=info',
+    'https://thu.edu.cn/a:b/c',
+]
+
+
+def check() -> None:
+    for url in URLS:
+        assert webvpn(url) == webvpn_reference(url), url
+    assert webvpn_batch(URLS + URLS) == [webvpn_reference(url) for url in URLS + URLS]
+
+
+def main() -> None:
+    check()
+    print(f'{len(URLS)} urls match the reference implementation')
+
+    number = 2000
+    encrypt.cache_clear()
+    for name, stmt in [
+        ('reference', lambda: [webvpn_reference(url) for url in URLS]),
+        ('webvpn', lambda: [webvpn(url) for url in URLS]),
+        ('webvpn_batch', lambda: webvpn_batch(URLS)),
+    ]:
+        seconds = min(timeit.repeat(stmt, number=number, repeat=5))
+        print(f'{name:>14}: {seconds / number / len(URLS) * 1e6:8.2f} us/url')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,11 @@
+import asyncio
 import configparser
+import functools
 import logging
 import sys
 import traceback
 from datetime import datetime, time, timedelta
+from time import perf_counter
 from logging import Filter
 from logging.handlers import TimedRotatingFileHandler
 from typing import Optional
@@ -11,20 +14,26 @@ from pytz import timezone
 from telegram import (BotCommandScopeChat, BotCommandScopeDefault, Chat,
                       Message, Update)
 from telegram.error import Forbidden, TelegramError
-from telegram.ext import (Application, CommandHandler, ContextTypes, JobQueue,
-                          MessageHandler, Updater, filters)
-
-from base import message
-from base.config import accessToken, group, pipe, webhookConfig
+from telegram.ext import (Application, ApplicationBuilder, CommandHandler,
+                          ContextTypes, JobQueue, MessageHandler, Updater,
+                          filters)
+
+import base.job as jb
+from base import message, metrics, persist, snapshot
+from base.concurrency import OrderedUpdateProcessor
+from base.config import (accessToken, group, metricsConfig, owner, pipe,
+                         useUvloop, webhookConfig, workers)
 from base.log import logger
 from base.mute import mute, mute_show, unmute
 from base.pool import auto_delete
-from command.gadget import (callpolice, fan, gu, payme, payme_upload, register,
-                            roll, san, yue)
+from base.watchdog import watchdog
+from command.diagnose import jobs, lag, profile
+from command.gadget import (callpolice, fan, gu, payme, payme_cleanup,
+                            payme_upload, register, roll, san, yue)
 from command.heartbeat import send_heartbeat
-from command.info import daily_report, info
-from command.weather import (realtime_forecast, realtime_weather, weather_poll,
-                             weather_report)
+from command.info import daily_report, info, search
+from command.weather import (realtime_forecast, realtime_weather, subscribe,
+                             unsubscribe, weather_poll, weather_report)
 
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -36,23 +45,85 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
     logger.debug(update_str)
 
 
-def main():
-    """Start the bot."""
-    app = Application.builder().token(accessToken).build()
+handler_calls = metrics.Counter('bot_updates_total', 'Updates handled, by handler and outcome', ('handler', 'outcome'))
+handler_seconds = metrics.Histogram('bot_handler_seconds', 'Duration of update handlers', ('handler',))
+
+
+def instrument_handlers(app: Application) -> None:
+    """Count the calls of every handler callback and time them."""
+    def timed(callback):
+        name = callback.__name__
+
+        @functools.wraps(callback)
+        async def wrap(update, context):
+            start = perf_counter()
+            outcome = 'error'
+            try:
+                ret = await callback(update, context)
+                outcome = 'ok'
+                return ret
+            finally:
+                handler_calls.labels(name, outcome).inc()
+                handler_seconds.labels(name).observe(perf_counter() - start)
+        return wrap
+
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            handler.callback = timed(handler.callback)
+
+
+async def post_init(app: Application) -> None:
+    """Restore the state saved before the last restart, start the event loop watchdog and the metrics server."""
+    snapshot.restore()
+    watchdog.start()
+    await metrics.start_server(**metricsConfig)
+
+
+async def post_shutdown(app: Application) -> None:
+    """Write the volatile state and the pending state files before exit."""
+    await watchdog.stop()
+    await metrics.stop_server()
+    snapshot.save()
+    await persist.flush()
+
+
+def install_uvloop() -> bool:
+    """Make the event loops created from now on uvloop ones, if uvloop is installed."""
+    try:
+        import uvloop
+    except ImportError:
+        logger.warning('uvloop is not installed, using the default event loop')
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
+def build_app(builder: Optional[ApplicationBuilder] = None) -> Application:
+    """
+    Build the application with all handlers and jobs registered.
+    `builder` defaults to one with the configured token, the load harness passes its own.
+    """
+    if builder is None:
+        builder = Application.builder().token(accessToken)
+    app = builder.concurrent_updates(OrderedUpdateProcessor(workers)) \
+        .post_init(post_init).post_shutdown(post_shutdown).build()
 
     app.add_error_handler(error_handler)
     message.init(app.bot)
 
     f_group = filters.Chat(group)
     f_pipe = filters.Chat(pipe)
+    f_owner = filters.User(owner)
 
     assert app.job_queue
     job: JobQueue = app.job_queue
     tz = timezone("Asia/Shanghai")  # local_tz
     jk = {"misfire_grace_time": None}  # job_kwargs
+    jb.listen(job)
 
     groupCommands = []
     allCommands = []
+    privateCommands = []
 
     # ===== weather =====
     # 定期获取天气数据
@@ -63,6 +134,11 @@ def main():
     # 当前位置降雨概率
     app.add_handler(CommandHandler('forecast', realtime_forecast))
     allCommands.append(('forecast', '此时清华的降雨概率', 46))
+    # 私聊订阅降雨预警
+    app.add_handler(CommandHandler('subscribe', subscribe, filters=filters.ChatType.PRIVATE))
+    privateCommands.append(('subscribe', '私聊订阅降雨预警', 47))
+    app.add_handler(CommandHandler('unsubscribe', unsubscribe, filters=filters.ChatType.PRIVATE))
+    privateCommands.append(('unsubscribe', '取消订阅降雨预警', 48))
     # 天气预报以及更新
     for hour in range(24):
         job.run_daily(weather_report, time=time(hour, 0, 0, tzinfo=tz),
@@ -75,6 +151,8 @@ def main():
     groupCommands.append(('unmute', '解除屏蔽发布源', 72))
     app.add_handler(CommandHandler('mute_list', mute_show, filters=f_group))
     groupCommands.append(('mute_list', '列出所有被屏蔽的发布源', 73))
+    app.add_handler(CommandHandler('search', search))
+    allCommands.append(('search', '搜索历史发布信息', 74))
     app.add_handler(MessageHandler(
         f_pipe & filters.UpdateType.CHANNEL_POST, info))
     job.run_daily(daily_report, time=time(23, 0, 0, tzinfo=tz))
@@ -100,13 +178,23 @@ def main():
     groupCommands.append(('san', '饭饱散伙', 125))
     app.add_handler(MessageHandler(
         filters.ChatType.PRIVATE & filters.PHOTO, payme_upload))
+    job.run_daily(payme_cleanup, time=time(4, 0, 0, tzinfo=tz))
+
+    # ===== diagnose (owner) =====
+    app.add_handler(CommandHandler('profile', profile, filters=f_owner))
+    app.add_handler(CommandHandler('lag', lag, filters=f_owner))
+    app.add_handler(CommandHandler('jobs', jobs, filters=f_owner))
 
     # ===== other =====
     job.run_repeating(send_heartbeat, interval=60, first=0, job_kwargs=jk)
     job.run_repeating(auto_delete, interval=60, first=30, job_kwargs=jk)
+    job.run_repeating(snapshot.save_snapshot, interval=300, first=300, job_kwargs=jk)
+
+    instrument_handlers(app)
 
     # Add commands into menu
     groupCommands += allCommands
+    allCommands += privateCommands
     groupCommands = sorted(groupCommands, key=lambda x: x[2])
     groupCommands = [(x[0], x[1]) for x in groupCommands]
     allCommands = sorted(allCommands, key=lambda x: x[2])
@@ -117,6 +205,14 @@ def main():
         await context.bot.set_my_commands(groupCommands, scope=BotCommandScopeChat(group))
     job.run_once(set_commands, when=0, job_kwargs=jk)
 
+    return app
+
+
+def main():
+    """Start the bot."""
+    if useUvloop and install_uvloop():
+        logger.info('using uvloop')
+    app = build_app()
     logger.info('bot start')
     app.run_webhook(**webhookConfig)
 
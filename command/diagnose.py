@@ -0,0 +1,40 @@
+import asyncio
+import threading
+from datetime import datetime
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from base import job
+from base.log import logger
+from base.profiler import collapsed, sample_stacks
+from base.watchdog import watchdog
+
+
+async def profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """对事件循环线程采样若干秒，返回 collapsed stacks，可直接用 flamegraph.pl 或 speedscope 打开"""
+    assert update.message
+    try:
+        seconds = min(max(int(context.args[0]), 1), 120) if context.args else 10
+    except ValueError:
+        await update.message.reply_text('Usage: /profile [seconds]')
+        return
+    await update.message.reply_text(f'Profiling for {seconds}s...')
+    logger.info(f'profile {seconds}s')
+    stacks = await asyncio.to_thread(sample_stacks, threading.get_ident(), seconds)
+    filename = datetime.now().strftime('profile_%Y%m%d_%H%M%S.collapsed')
+    await update.message.reply_document(
+        collapsed(stacks).encode(), filename=filename,
+        caption=f'{sum(stacks.values())} samples, {len(stacks)} stacks')
+
+
+async def lag(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """事件循环延迟分位数以及阻塞最久的函数"""
+    assert update.message
+    await update.message.reply_text(watchdog.report())
+
+
+async def jobs(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """定时任务的运行次数、耗时、延迟以及被跳过的次数"""
+    assert update.message
+    await update.message.reply_text(job.report())
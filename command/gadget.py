@@ -1,8 +1,9 @@
+import asyncio
 import io
 import json
-import os
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from random import Random
 from typing import Optional
@@ -11,11 +12,14 @@ import numpy as np
 import qrcode
 from PIL import Image
 from pyzbar.pyzbar import decode
-from telegram import InputMediaPhoto, Update
+from telegram import InputMediaPhoto, PhotoSize, Update
 from telegram.ext import ContextTypes
 
+import base.paycode as pc
+from base import snapshot
 from base.debug import eprint
 from base.format import escaped
+from base.job import tracked_job
 from base.log import logger
 
 
@@ -62,23 +66,23 @@ dig = np.array([
 ]) * 255
 
 
-def generator_register(id: str, tm: str) -> Optional[str]:
+template = np.array(Image.open('template/template.jpg').convert('L'))
+glyphs = dig.reshape(10, 7, 4).astype(np.uint8)
+points = [29, 35, 41, 47, 53, 59]
+
+
+def generator_register(id: str, tm: str) -> Optional[bytes]:
+    """Render the register picture in memory, return PNG bytes."""
     try:
-        pic = f'./tmp/{id}_{tm}.png'
-        if not os.path.exists(pic):
-            tmp = f'./tmp/{int(time.time())}.png'
-            qrcode.make(id).save(tmp)  # type: ignore
-            bg = np.array(Image.open('template/template.jpg').convert('L'))
-            tmp = np.array(Image.open(tmp).convert('L'))[40:-45, 40:-45]
-            tmp = np.array(Image.fromarray(tmp).resize((41, 41)))
-            bg[14:55, 25:66] = tmp
-            points = [29, 35, 41, 47, 53, 59]
-            edit = [int(_) for _ in tm]
-            for i in range(6):
-                x, y, d = 55, points[i], edit[i]
-                bg[x:x+7, y:y+4] = dig[d].reshape(7, 4)
-            Image.fromarray(bg).save(pic)
-        return pic
+        qr = np.array(qrcode.make(id).get_image().convert('L'))[40:-45, 40:-45]
+        qr = np.array(Image.fromarray(qr).resize((41, 41)))
+        bg = template.copy()
+        bg[14:55, 25:66] = qr
+        for y, d in zip(points, tm):
+            bg[55:62, y:y+4] = glyphs[int(d)]
+        buf = io.BytesIO()
+        Image.fromarray(bg).save(buf, format='PNG')
+        return buf.getvalue()
     except Exception as e:
         eprint(e)
 
@@ -94,10 +98,9 @@ async def register(update: Update, context: ContextTypes.DEFAULT_TYPE):
         assert len(re.findall(r'^\d{10}$', args[0])) == 1
         assert len(re.findall(r'^\d{6}$', args[1])) == 1
 
-        pic = generator_register(args[0], args[1])
+        pic = await asyncio.to_thread(generator_register, args[0], args[1])
         assert pic is not None
-        await update.message.reply_photo(open(pic, 'rb'))
-        Path(pic).unlink()
+        await update.message.reply_photo(pic)
     except:
         await update.message.reply_text('Usage: /register [StudentID] [Month]\nExample: /register 1994990239 202102')
 
@@ -138,35 +141,82 @@ async def san(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text('散🎉')
 
 
+def load_users(state: dict, elapsed: float) -> None:
+    global users
+    users = {int(user_id): user_name for user_id, user_name in state.items()}
+
+
+snapshot.register('yue', lambda: users, load_users)
+
+
+decode_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='qrdecode')
+DECODE_SMALL = 640  # 先尝试不小于这个尺寸的较小 PhotoSize
+DECODE_DOWNSCALE = 1024  # 再尝试缩小到这个尺寸的灰度原图
+
+
+def decode_qr(buf: bytes | bytearray, max_side: Optional[int] = None) -> list[str]:
+    img = Image.open(io.BytesIO(buf)).convert('L')
+    if max_side is not None and max(img.size) > max_side:
+        img.thumbnail((max_side, max_side))
+    return [res.data.decode() for res in decode(img)]
+
+
+async def decode_photo(photo: tuple[PhotoSize, ...]) -> tuple[list[str], bytearray]:
+    """
+    Decode QRCodes in a worker thread, from cheap to expensive:
+    a smaller PhotoSize, the largest one downscaled, then the largest one at full resolution.
+    Return the codes found and the bytes of the largest PhotoSize, which is downloaded while the smaller one is decoded.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def stage(name: str, buf: bytes | bytearray, max_side: Optional[int] = None) -> list[str]:
+        start = time.perf_counter()
+        codes = await loop.run_in_executor(decode_pool, decode_qr, buf, max_side)
+        logger.debug(f'qrdecode {name}: {len(codes)} codes in {time.perf_counter() - start:.3f}s')
+        return codes
+
+    async def download(size: PhotoSize) -> bytearray:
+        return await (await size.get_file()).download_as_bytearray()
+
+    codes: list[str] = []
+    largest = photo[-1]
+    small = next((x for x in photo[:-1] if max(x.width, x.height) >= DECODE_SMALL), None)
+    full = asyncio.create_task(download(largest))
+    if small is not None:
+        try:
+            codes = await stage(f'small {small.width}x{small.height}', await download(small))
+        except BaseException:
+            full.cancel()
+            raise
+    buf = await full
+    if not codes and max(largest.width, largest.height) > DECODE_DOWNSCALE:
+        codes = await stage(f'downscaled {DECODE_DOWNSCALE}', buf, DECODE_DOWNSCALE)
+    if not codes:
+        codes = await stage(f'full {largest.width}x{largest.height}', buf)
+    return codes, buf
+
+
 async def payme_upload(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     assert update.message and update.message.from_user
     user_id = update.message.from_user.id
-    folder = Path(f'./data/pay/{user_id}')
-    folder.mkdir(exist_ok=True)
+    providers = [
+        ('https://qr.alipay.com/', 'ali', 'Alipay'),
+        ('wxp://', 'wx', 'Wechat'),
+        ('https://qr.95516.com/', 'uni', 'UnionPay'),
+    ]
     try:
-        file = await update.message.photo[-1].get_file()
-        buf = await file.download_as_bytearray()
-        for res in decode(Image.open(io.BytesIO(buf))):
-            url: str = res.data.decode()
-            if url.startswith('https://qr.alipay.com/'):
-                with (folder / 'ali.png').open('wb') as f:
-                    f.write(buf)
-                await update.message.reply_text('检测到：Alipay 收款码')
-                return
-            elif url.startswith('wxp://'):
-                with (folder / 'wx.png').open('wb') as f:
-                    f.write(buf)
-                await update.message.reply_text('检测到：Wechat 收款码')
-                return
-            elif url.startswith('https://qr.95516.com/'):
-                with (folder / 'uni.png').open('wb') as f:
-                    f.write(buf)
-                await update.message.reply_text('检测到：UnionPay 收款码')
-                return
-            else:
-                await update.message.reply_text('Unsupported QRCode')
-                logger.warning(url)
-                return
+        codes, buf = await decode_photo(update.message.photo)
+        for url in codes:
+            for prefix, name, provider in providers:
+                if url.startswith(prefix):
+                    if pc.put(user_id, name, buf, update.message.photo[-1].file_id):
+                        await update.message.reply_text(f'检测到：{provider} 收款码')
+                    else:
+                        await update.message.reply_text(f'{provider} 收款码已存在')
+                    return
+            await update.message.reply_text('Unsupported QRCode')
+            logger.warning(url)
+            return
     except Exception as e:
         await update.message.reply_text('QRCode not found')
         eprint(e)
@@ -175,9 +225,24 @@ async def payme_upload(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 async def payme(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     assert update.message and update.message.from_user
     user_id = update.message.from_user.id
-    folder = Path(f'./data/pay/{user_id}')
-    if not (folder.exists() and len(list(folder.iterdir()))):
+    codes = pc.codes(user_id)
+    if not codes:
         await update.message.reply_text('No QRCodes found, send to me first!')
         return
-    images = [InputMediaPhoto(file.open('rb')) for file in folder.iterdir()]
-    await update.message.reply_media_group(images)
+    media = [code['file_id'] or Path(code['path']).read_bytes() for code in codes]
+    if len(codes) == 1:
+        msgs = [await update.message.reply_photo(media[0])]
+    else:
+        msgs = await update.message.reply_media_group([InputMediaPhoto(x) for x in media])
+    uploaded = {code['provider']: msg.photo[-1].file_id
+                for code, msg in zip(codes, msgs) if code['file_id'] is None and msg.photo}
+    if uploaded:
+        pc.set_file_ids(user_id, uploaded)
+
+
+@tracked_job
+async def payme_cleanup(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """清理失效的收款码"""
+    removed = pc.cleanup()
+    if removed:
+        logger.info(f'payme cleanup: {removed} removed')
@@ -2,9 +2,11 @@ from telegram.ext import ContextTypes
 
 from base import network
 from base.config import heartbeatURL
+from base.job import tracked_job
 from base.log import logger
 
 
+@tracked_job
 async def send_heartbeat(context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.debug('heartbeat')
     await network.get(url=heartbeatURL)
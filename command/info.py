@@ -1,23 +1,123 @@
 import json
+import time
 import traceback
+from datetime import datetime
+from typing import Optional
 
+from pytz import timezone
 from telegram import Update
-from telegram.ext import ContextTypes
+from telegram.ext import ContextTypes, Job
 
 import base.mute as mt
-from base.config import group
+from base.config import coalesceMax, coalesceQuiet, group
+from base.dedup import DedupIndex
 from base.format import escaped
+from base.infodb import (add_info, info_by_msgid, info_since, iter_info,
+                         pop_info, search_info, set_msgid)
+from base.job import tracked_job
 from base.log import logger
-from base.webvpn import webvpn
+from base.message import delete_msg, edit_msg_text
+from base.webvpn import webvpn_batch
 
-try:
-    with open('data/today.json', 'r') as file:
-        today = json.load(file)
-except:
-    today = {}
+# 只索引发到群里的 info，被屏蔽的不算，否则其他来源的同一条会被当成重复而吞掉
+dedup = DedupIndex()
+for row in iter_info(time.time() - dedup.window):
+    if mt.match(row['source'], row['title']) is None:
+        dedup.add(row['url'], row['source'], row['title'], row['created'])
+
+
+# ==================== coalesce ====================
+# 新 info 先进入 pending，静默 coalesceQuiet 秒后一并发送；
+# 持续有新 info 到达时窗口随之延长，但最多等待 coalesceMax 秒。
+# 发送后 coalesceMax 秒内到达的 info 会追加编辑到同一条消息。
+# 正在发送的 info 记在 inflight 中，期间收到的 delinfo 记入 deleted，等 msgid 写入后再从消息中删去。
+
+pending: list[dict] = []
+inflight: set[str] = set()
+deleted: set[str] = set()
+pending_since = 0.0
+flush_job: Optional[Job] = None
+digest_msgid: Optional[int] = None
+digest_time = 0.0
+
+
+def info_text(items: list[dict]) -> str:
+    vpns = webvpn_batch(x['url'] for x in items)
+    return '\n\n'.join('Info %s\n[%s](%s) [\\(webvpn\\)](%s)' % (
+        escaped(x['source']), escaped(x['title']), x['url'], vpn) for x, vpn in zip(items, vpns))
+
+
+def split_items(items: list[dict]) -> list[list[dict]]:
+    """Split items into chunks that each fit in one message."""
+    chunks: list[list[dict]] = [[]]
+    for item in items:
+        if chunks[-1] and len(info_text(chunks[-1] + [item])) > 4096:
+            chunks.append([])
+        chunks[-1].append(item)
+    return chunks
+
+
+def schedule_flush(context: ContextTypes.DEFAULT_TYPE) -> None:
+    global flush_job
+    assert context.job_queue
+    if flush_job is not None:
+        flush_job.schedule_removal()
+    delay = max(min(coalesceQuiet, pending_since + coalesceMax - time.time()), 0)
+    flush_job = context.job_queue.run_once(flush_info, delay)
+
+
+@tracked_job
+async def flush_info(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """发送 pending 中的 info"""
+    global flush_job
+    flush_job = None
+    if not pending:
+        return
+    items = pending[:]
+    pending.clear()
+    urls = {x['url'] for x in items}
+    inflight.update(urls)
+    try:
+        await send_items(context, items)
+    finally:
+        inflight.difference_update(urls)
+        for url in deleted & urls:
+            deleted.discard(url)
+            await remove_info(url)
+
+
+async def send_items(context: ContextTypes.DEFAULT_TYPE, items: list[dict]) -> None:
+    global digest_msgid, digest_time
+    if digest_msgid is not None and time.time() - digest_time < coalesceMax:
+        merged = info_by_msgid(digest_msgid) + items
+        text = info_text(merged)
+        if len(text) <= 4096 and await edit_msg_text(
+                group, digest_msgid, text, parse_mode='MarkdownV2', disable_web_page_preview=True):
+            set_msgid([x['url'] for x in items], digest_msgid)
+            return
+
+    for chunk in split_items(items):
+        msg = await context.bot.send_message(
+            chat_id=group, text=info_text(chunk), parse_mode='MarkdownV2', disable_web_page_preview=True)
+        set_msgid([x['url'] for x in chunk], msg.message_id)
+        digest_msgid = msg.message_id
+    digest_time = time.time()
+
+
+async def remove_info(url: str) -> None:
+    """删除 info，并从发送它的消息中删去"""
+    _, msgid = pop_info(url)
+    if msgid is not None:
+        rest = info_by_msgid(msgid)
+        if rest:
+            await edit_msg_text(group, msgid, info_text(rest),
+                                parse_mode='MarkdownV2', disable_web_page_preview=True)
+        else:
+            await delete_msg(group, msgid)
 
 
 async def info(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global pending_since
     assert update.channel_post and update.channel_post.text
     try:
         rev = json.loads(update.channel_post.text)
@@ -25,55 +125,83 @@ async def info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         data = rev['data']
 
         if rev['type'] == 'newinfo':
-            url = data['url']
-            today[url] = data
-            today[url]['msgid'] = None
-            if data['source'] not in mt.muted:
-                text = 'Info %s\n[%s](%s) [\\(webvpn\\)](%s)' % (escaped(
-                    data['source']), escaped(data['title']), data['url'], webvpn(data['url']))
-                msg = await context.bot.send_message(
-                    chat_id=group, text=text, parse_mode='MarkdownV2', disable_web_page_preview=True)
-                today[url]['msgid'] = msg.message_id
+            if mt.is_muted(data['source'], data['title']):
+                add_info(data, None)
+                return
+
+            dup = dedup.find(data['url'], data['source'], data['title'])
+            if dup is not None:
+                logger.info(f'duplicate of {dup.url}, suppressed')
+                if dup.url != data['url']:
+                    add_info(data, None, dup.url)
+                    dedup.add(data['url'], data['source'], data['title'])
+                return
+
+            add_info(data, None)
+            dedup.add(data['url'], data['source'], data['title'])
+            if not pending:
+                pending_since = time.time()
+            pending.append(data)
+            schedule_flush(context)
 
         elif rev['type'] == 'delinfo':
             url = data
-            if url in today.keys():
-                if today[url]['msgid'] is not None:
-                    await context.bot.delete_message(chat_id=group, message_id=today[url]['msgid'])
-                del today[url]
-
-        with open('data/today.json', 'w') as file:
-            json.dump(today, file)
+            dedup.remove(url)
+            pending[:] = [x for x in pending if x['url'] != url]
+            if url in inflight:
+                deleted.add(url)
+            else:
+                await remove_info(url)
 
     except Exception as e:
         logger.error(e)
         logger.debug(traceback.format_exc())
 
 
-def info_daily(clear=True):
-    ret = {}
-    for info in today.values():
-        if info['source'] not in ret.keys():
-            ret[info['source']] = []
-        ret[info['source']].append(info)
-    if clear:
-        today.clear()
-        with open('data/today.json', 'w') as file:
-            json.dump(today, file)
-    return ret
+def info_daily(since: Optional[float] = None):
+    """
+    Items relayed within the last day (or after `since`), grouped by source.
+    """
+    if since is None:
+        since = time.time() - 24 * 3600
+    return info_since(since)
 
 
-async def daily_report(context: ContextTypes.DEFAULT_TYPE):
+def daily_texts(today: dict[str, list[dict]]) -> list[str]:
+    """Split the daily report into messages of at most 4096 characters."""
+    texts = []
     text = 'Today Info:'
-    today = info_daily()
     for source in today.keys():
         _text = ' \\- %s' % escaped(source)
         for news in today[source]:
             _text += '\n[%s](%s)' % (escaped(news['title']), news['url'])
         if len(text + '\n' + _text) > 4096:
-            await context.bot.send_message(
-                chat_id=group, text=text, parse_mode='MarkdownV2', disable_web_page_preview=True)
+            texts.append(text)
             text = 'Today Info:'
         text += '\n' + _text
-    await context.bot.send_message(
-        chat_id=group, text=text, parse_mode='MarkdownV2', disable_web_page_preview=True)
+    texts.append(text)
+    return texts
+
+
+@tracked_job
+async def daily_report(context: ContextTypes.DEFAULT_TYPE):
+    for text in daily_texts(info_daily()):
+        await context.bot.send_message(
+            chat_id=group, text=text, parse_mode='MarkdownV2', disable_web_page_preview=True)
+
+
+async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """搜索历史 info"""
+    assert update.message
+    if not context.args:
+        await update.message.reply_text('Usage: /search [keywords]')
+        return
+    results = search_info(' '.join(context.args))
+    if not results:
+        await update.message.reply_text('No results')
+        return
+    tz = timezone("Asia/Shanghai")
+    text = '\n'.join('%s %s\n[%s](%s)' % (
+        escaped(datetime.fromtimestamp(x['created'], tz).strftime('%Y-%m-%d')),
+        escaped(x['source']), escaped(x['title']), x['url']) for x in results)
+    await update.message.reply_text(text, parse_mode='MarkdownV2', disable_web_page_preview=True)
@@ -2,24 +2,29 @@ import json
 import logging
 import os
 from datetime import datetime, timedelta
-from typing import cast
+from typing import Optional, cast
 
 import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 from PIL import Image
 from pytz import timezone
-from telegram import Bot, InputMediaPhoto, Message, Update
+from telegram import Bot, Message, Update
 from telegram.error import TimedOut
 from telegram.ext import ContextTypes
 
-from base.config import channel, config, group
+from base import broadcast, persist, snapshot
+from base.concurrency import gather_bounded
+from base.config import alertChats, config, group, reportChats
 from base.debug import try_except
 from base.format import escaped
+from base.job import tracked_job
 from base.log import logger
-from base.message import delete_msg, edit_msg_media
+from base.metrics import Gauge
+from base.message import delete_msg
 from base.pool import add_pool
-from base.weather import CaiyunAPIError, caiyun_api, daily_weather, now_weather
+from base.weather import (CaiyunAPIError, caiyun_api, daily_weather, data_age,
+                          now_weather, nowcast)
 
 matplotlib.use('Agg')
 
@@ -40,10 +45,11 @@ async def weather_update():
     """更新彩云天气数据"""
     global caiyunData
     caiyunData = await caiyun_api(config['CAIYUN']['longitude'], config['CAIYUN']['latitude'])
-    with open('data/caiyun.json', 'w') as file:
-        json.dump(caiyunData, file)
+    persist.save('data/caiyun.json', caiyunData)
 
 
+Gauge('bot_caiyun_data_age_seconds', 'Age of the latest Caiyun data').set_function(lambda: data_age(caiyunData))
+
 # ==================== rain ====================
 
 start_probability = 0.8
@@ -53,34 +59,39 @@ stop_precipitation = 0.01
 rain_2h = rain_60 = rain_15 = rain_0 = False
 rainfall = False
 alert_text = ''
-
-try:
-    weather_msgid = json.load(
-        open('data/weather_msgid.json', 'r'))
-except Exception:
-    weather_msgid = 0
+forecast_max_age = 10 * 60  # /forecast 在数据不超过这么多秒时直接用平移后的预报，不重新获取
 
 
 async def rain_alert(bot: Bot, text: str):
-    """降雨预警"""
-    global alert_text, weather_msgid
+    """降雨预警，发到预警群并私聊订阅的用户"""
+    global alert_text
     if alert_text == text:
         return
     alert_text = text
-    await delete_msg(group, weather_msgid)
-    msg: Message = await bot.send_message(chat_id=group, text=text)
-    weather_msgid = msg.message_id
-    with open('data/weather_msgid.json', 'w') as file:
-        json.dump(weather_msgid, file)
+    await broadcast.send_text(bot, 'rain_alert', alertChats + broadcast.subscribers(), text)
+
+
+def crossed(precipitation: float, raining: bool) -> bool:
+    """降雨强度是否越过了开始或停止降雨的阈值"""
+    return (precipitation < stop_precipitation and raining) or (precipitation > start_precipitation and not raining)
+
+
+def rain_crossed(data: dict) -> bool:
+    """按这份预报，forecast_rain 是否会改变降雨状态"""
+    if data == {} or data['result']['minutely']['status'] != 'ok':
+        return False
+    precipitation = data['result']['minutely']['precipitation_2h']
+    return crossed(precipitation[60], rain_60) or crossed(precipitation[15], rain_15) or crossed(precipitation[0], rain_0)
 
 
 async def forecast_rain(bot: Bot):
-    """根据两小时内的降雨预测发出预警"""
-    if caiyunData == {} or caiyunData['result']['minutely']['status'] != 'ok':
+    """根据两小时内的降雨预测（按数据获取后经过的时间平移）发出预警"""
+    data = nowcast(caiyunData)
+    if data == {} or data['result']['minutely']['status'] != 'ok':
         return
 
     global rain_2h
-    probability_2h = caiyunData['result']['minutely']['probability']
+    probability_2h = data['result']['minutely']['probability']
     if max(probability_2h) < stop_probability and rain_2h == True:
         rain_2h = False
         logger.debug('rain_2h T to F')
@@ -91,19 +102,19 @@ async def forecast_rain(bot: Bot):
 
     global rain_60, rain_15, rain_0
     changed = False
-    precipitation = caiyunData['result']['minutely']['precipitation_2h']
-    if (precipitation[60] < stop_precipitation and rain_60 == True) or (precipitation[60] > start_precipitation and rain_60 == False):
+    precipitation = data['result']['minutely']['precipitation_2h']
+    if crossed(precipitation[60], rain_60):
         rain_60 = not rain_60
         changed = True
-    if (precipitation[15] < stop_precipitation and rain_15 == True) or (precipitation[15] > start_precipitation and rain_15 == False):
+    if crossed(precipitation[15], rain_15):
         rain_15 = not rain_15
         changed = True
-    if (precipitation[0] < stop_precipitation and rain_0 == True) or (precipitation[0] > start_precipitation and rain_0 == False):
+    if crossed(precipitation[0], rain_0):
         rain_0 = not rain_0
         changed = True
 
     if changed:
-        await rain_alert(bot, caiyunData['result']['forecast_keypoint'])
+        await rain_alert(bot, data['result']['forecast_keypoint'])
 
     global rainfall
     rainfall = rain_2h or rain_60 or rain_15 or rain_0
@@ -118,31 +129,48 @@ except Exception:
     alert_info = {}
 
 
+alert_concurrency = 4  # 同时进行的发送与删除
+delete_attempts = 3  # 删除失败时，之后的更新中再重试的次数
+
+
 async def alert_info_update(bot: Bot):
-    """更新预警信息"""
+    """
+    更新预警信息
+    只处理与上次相比新增和解除的预警：发送与删除并发进行，全部完成后统一保存一次
+    发送失败的预警不记录，下次更新时重新发送；删除失败的消息在之后的更新中重试
+    """
     if caiyunData == {} or caiyunData['result']['alert']['status'] != 'ok':
         return
 
-    modified = False
-    alertIds = [each['alertId']
-                for each in caiyunData['result']['alert']['content']]
-    for id in list(alert_info.keys()):
-        if id not in alertIds:
-            await delete_msg(group, alert_info[id]['msgid'])
+    content = caiyunData['result']['alert']['content']
+    present = {each['alertId'] for each in content}
+    removed = list(alert_info.keys() - present)
+    added = {each['alertId']: each for each in content
+             if each['request_status'] == 'ok' and each['alertId'] not in alert_info}
+    if not removed and not added:
+        return
+
+    async def send(each: dict) -> Message:
+        text = '*%s*\n\n%s' % (escaped(each['title']), escaped(each['description']))
+        return await bot.send_message(chat_id=group, text=text, parse_mode='MarkdownV2')
+
+    results = await gather_bounded(
+        [delete_msg(group, alert_info[id]['msgid']) for id in removed] +
+        [send(each) for each in added.values()], alert_concurrency)
+
+    for id, deleted in zip(removed, results):
+        attempts = alert_info[id].get('delete_attempts', 0) + 1
+        if deleted is True or attempts >= delete_attempts:
             del alert_info[id]
-    for each in caiyunData['result']['alert']['content']:
-        if each['request_status'] == 'ok' and each['alertId'] not in alert_info:
-            text = '*%s*\n\n%s' % (escaped(each['title']),
-                                   escaped(each['description']))
-            msg = await bot.send_message(chat_id=group, text=text,
-                                         parse_mode='MarkdownV2')
-            # mark_autodel(msg)
-            each['msgid'] = msg.message_id
-            alert_info[each['alertId']] = each
-            modified = True
-    if modified:
-        with open('data/alert_info.json', 'w') as file:
-            json.dump(alert_info, file)
+        else:
+            alert_info[id]['delete_attempts'] = attempts
+    for (id, each), msg in zip(added.items(), results[len(removed):]):
+        if isinstance(msg, BaseException):
+            logger.warning(f'alert {id} not sent: {msg}')
+            continue
+        each['msgid'] = msg.message_id
+        alert_info[id] = each
+    persist.save('data/alert_info.json', alert_info)
 
 
 # ==================== pic ====================
@@ -180,12 +208,13 @@ def temperature_graph():
 
 
 @try_except(level=logging.WARNING)
-def precipitation_graph():
-    """未来 2 小时降雨概率折线图"""
+def precipitation_graph(data: Optional[dict] = None):
+    """未来 2 小时降雨概率折线图，默认使用最近获取的数据"""
     pic = f'./tmp/precipitation.png'
     logger.debug(f'file {pic} created')
 
-    precipitation = caiyunData['result']['minutely']['precipitation_2h']
+    data = caiyunData if data is None else data
+    precipitation = data['result']['minutely']['precipitation_2h']
     plt.figure(figsize=(6, 3))
     plt.plot(np.arange(120), np.array(precipitation))
     plt.ylim(bottom=0)
@@ -224,60 +253,90 @@ def mixed_graph():
 
 # ==================== weather report ====================
 
-try:
-    weather_report_msgid = json.load(
-        open('data/weather_report_msgid.json', 'r'))
-except Exception:
-    weather_report_msgid = {'group': 0, 'channel': 0}
-
-
+@tracked_job
 @try_except(exclude=(TimedOut,))
 async def weather_report(context: ContextTypes.DEFAULT_TYPE) -> None:
     """定时发送或者更新天气预报"""
     assert context.job
     hour = cast(int, context.job.data)
     text = daily_weather(caiyunData, hour)
+    pic = mixed_graph()
     if hour == 6 or hour == 18:
-        await delete_msg(group, weather_report_msgid['group'])
-        await delete_msg(channel, weather_report_msgid['channel'])
-        pic = mixed_graph()
-        msg = await context.bot.send_photo(group, open(pic, 'rb'), text)
-        weather_report_msgid['group'] = msg.message_id
-        msg = await context.bot.send_photo(channel, open(pic, 'rb'), text)
-        weather_report_msgid['channel'] = msg.message_id
-        with open('data/weather_report_msgid.json', 'w') as file:
-            json.dump(weather_report_msgid, file)
+        await broadcast.send_photo(context.bot, 'weather_report', reportChats, pic, text)
     else:
-        pic = mixed_graph()
-        pic = InputMediaPhoto(media=open(pic, 'rb'), caption=text)
-        await edit_msg_media(group, weather_report_msgid['group'], pic)
-        await edit_msg_media(channel, weather_report_msgid['channel'], pic)
+        await broadcast.edit_photo(context.bot, 'weather_report', pic, text)
 
 
 # ==================== poll ====================
 
 remain_minutes = 0
+forced_interval = 5  # 按平移预报提前更新时，两次提前更新至少间隔的分钟数
+forced_cooldown = 0
 
 
+@tracked_job
 async def weather_poll(context: ContextTypes.DEFAULT_TYPE):
     """定时更新天气数据"""
     # 如果降雨则更新粒度为 5mins
     # 如果不降雨则更新粒度为 15mins
-    global remain_minutes
+    # 两次更新之间按平移后的预报判断，预计降雨状态改变时提前更新
+    # 新数据可能每次都把降雨推迟一点，提前更新因此有最小间隔，避免每分钟都请求彩云
+    global remain_minutes, forced_cooldown
     remain_minutes -= 1
+    forced_cooldown -= 1
+    if remain_minutes > 0 and forced_cooldown <= 0 and rain_crossed(nowcast(caiyunData)):
+        logger.debug('nowcast crossed a rain threshold, update now')
+        remain_minutes = 0
+        forced_cooldown = forced_interval
     if remain_minutes <= 0:
         if await weather_update():
             await forecast_rain(context.bot)
             await alert_info_update(context.bot)
             remain_minutes = 5 if rainfall else 15
         else:
-            # 如果更新失败则 2mins 后重试
+            # 如果更新失败则 2mins 后重试，先按平移后的旧预报判断
+            await forecast_rain(context.bot)
             remain_minutes = 2
         logger.debug(f'next update: {remain_minutes} mins')
 
 
+def dump_state() -> dict:
+    return {'rain_2h': rain_2h, 'rain_60': rain_60, 'rain_15': rain_15, 'rain_0': rain_0,
+            'rainfall': rainfall, 'alert_text': alert_text, 'remain_minutes': remain_minutes}
+
+
+def load_state(state: dict, elapsed: float) -> None:
+    """重启期间流逝的时间也计入下次更新的倒计时，数据没有过期就不必立即重新获取"""
+    global rain_2h, rain_60, rain_15, rain_0, rainfall, alert_text, remain_minutes
+    rain_2h, rain_60, rain_15, rain_0 = state['rain_2h'], state['rain_60'], state['rain_15'], state['rain_0']
+    rainfall = state['rainfall']
+    alert_text = state['alert_text']
+    remain_minutes = state['remain_minutes'] - int(elapsed // 60)
+
+
+snapshot.register('weather', dump_state, load_state)
+
+
 # ==================== realtime ====================
 
+async def subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """私聊订阅降雨预警"""
+    assert update.message and update.effective_user
+    if broadcast.subscribe(update.effective_user.id):
+        await update.message.reply_text('已订阅降雨预警，/unsubscribe 取消')
+    else:
+        await update.message.reply_text('已经订阅过了')
+
+
+async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """取消订阅降雨预警"""
+    assert update.message and update.effective_user
+    if broadcast.unsubscribe(update.effective_user.id):
+        await update.message.reply_text('已取消订阅降雨预警')
+    else:
+        await update.message.reply_text('没有订阅降雨预警')
+
+
 async def realtime_weather(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """实时天气预报"""
     assert update.message
@@ -292,18 +351,21 @@ async def realtime_weather(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def realtime_forecast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """实时降雨预报"""
     assert update.message
-    await weather_update()
-    if caiyunData == {} or caiyunData['result']['minutely']['status'] != 'ok':
+    if caiyunData == {} or data_age(caiyunData) > forecast_max_age:
+        await weather_update()
+    data = nowcast(caiyunData)
+    if data == {} or data['result']['minutely']['status'] != 'ok':
         await update.message.reply_text('天气数据获取失败')
         return
 
-    pic = precipitation_graph()
+    pic = precipitation_graph(data)
     if pic is None:
         await update.message.reply_text('图表生成错误')
         return
 
-    msg = await update.message.reply_photo(
-        photo=open(pic, 'rb'),
-        caption=caiyunData['result']['forecast_keypoint']
-    )
+    caption = data['result']['forecast_keypoint']
+    minutes = int(data_age(caiyunData) // 60)
+    if minutes > 0:
+        caption += f'（{minutes} 分钟前的预报）'
+    msg = await update.message.reply_photo(photo=open(pic, 'rb'), caption=caption)
     add_pool(msg)